@@ -1,6 +1,7 @@
 import requests
 import sys
 from shared.shared import sonarr
+from shared.arr import Sonarr
 
 
 sonarrHost = sonarr['host']
@@ -10,13 +11,19 @@ show_tvdbId = sys.argv[1]
 ep_num = int(sys.argv[2])
 season_num = int(sys.argv[3])
 
-s = requests.get(f"{sonarrHost}/api/v3/series/lookup?apiKey={sonarrAPIkey}&term=tvdb:{show_tvdbId}")
-sonarrShow = s.json()
+sonarrArr = Sonarr()
+sonarrMirror = sonarrArr.getMirror()
+if sonarrMirror.persistent:
+    sonarrMirror.sync()
+    seriesId = sonarrMirror.findByTvdbId(show_tvdbId).id
+else:
+    # Without a saved mirror, a lookup is cheaper than loading the whole library
+    seriesId = sonarrArr.lookup(f"tvdb:{show_tvdbId}")[0]['id']
 
-s = requests.get(f"{sonarrHost}/api/v3/episode?apiKey={sonarrAPIkey}&seriesId={sonarrShow[0]['id']}")
-sonarrEpisodes = s.json()
+# Live, episodes added by a metadata refresh leave no history for the mirror to pick up
+sonarrEpisodes = sonarrArr.getEpisodes(seriesId)
 
-sonarrEpisode = next(filter(lambda episode: episode['seasonNumber'] == season_num and ep_num + 1 == episode['episodeNumber'], sonarrEpisodes))
+sonarrEpisode = next(filter(lambda episode: episode['seasonNumber'] == season_num and ep_num + 1 == episode['episodeNumber'], sonarrEpisodes), None)
 
 if (sonarrEpisode and 
     sonarrEpisode['hasFile'] == False):
@@ -0,0 +1,86 @@
+import argparse
+import gc
+import json
+import threading
+import time
+import tracemalloc
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import requests
+from shared.arr import Radarr, Sonarr, Movie, Show
+
+def buildMovie(id):
+    return {
+        'id': id,
+        'title': f"Movie {id}",
+        'originalTitle': f"Movie {id}",
+        'alternateTitles': [{'sourceType': 'tmdb', 'movieMetadataId': id, 'title': f"Movie {id} Alternate {i}", 'id': id * 10 + i} for i in range(8)],
+        'sortTitle': f"movie {id}",
+        'sizeOnDisk': 8 * 1024 ** 3,
+        'status': 'released',
+        'overview': 'A synthetic movie used to measure memory. ' * 12,
+        'images': [{'coverType': coverType, 'url': f"/MediaCover/{id}/{coverType}.jpg", 'remoteUrl': f"https://image.tmdb.org/t/p/original/{id}-{coverType}.jpg"} for coverType in ('poster', 'fanart', 'banner')],
+        'path': f"/movies/Movie {id} ({2000 + id % 24})",
+        'monitored': True,
+        'hasFile': id % 3 != 0,
+        'genres': ['Action', 'Adventure', 'Science Fiction'],
+        'tags': [],
+        'ratings': {source: {'votes': 1000 + id, 'value': 7.5, 'type': 'user'} for source in ('imdb', 'tmdb', 'metacritic', 'rottenTomatoes')},
+        'statistics': {'movieFileCount': 1, 'sizeOnDisk': 8 * 1024 ** 3, 'releaseGroups': ['GROUP']}
+    }
+
+def buildShow(id):
+    seasons = [{'seasonNumber': seasonNumber, 'monitored': True, 'statistics': {'episodeFileCount': 10, 'episodeCount': 10, 'totalEpisodeCount': 10, 'sizeOnDisk': 20 * 1024 ** 3, 'releaseGroups': ['GROUP'], 'percentOfEpisodes': 100 if seasonNumber % 2 else 50}} for seasonNumber in range(1, 9)]
+    show = buildMovie(id)
+    show.update({'title': f"Show {id}", 'path': f"/tv/Show {id}", 'seasons': seasons})
+    return show
+
+def serve(body):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def measure(function):
+    gc.collect()
+    tracemalloc.start()
+    start = time.monotonic()
+    result = function()
+    seconds = time.monotonic() - start
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, retained, peak
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the memory of loading the whole library with .json() and full Media objects against the streamed compact records.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 15000], help='Numbers of movies and series in the generated libraries.')
+    args = parser.parse_args()
+
+    for arrClass, constructor, build in ((Radarr, Movie, buildMovie), (Sonarr, Show, buildShow)):
+        for size in args.sizes:
+            # Serialized before measuring, so only the client's memory is counted
+            body = json.dumps([build(id) for id in range(1, size + 1)]).encode()
+            server, host = serve(body)
+            arr = arrClass(host, 'benchmark')
+
+            full = lambda: [constructor(item) for item in requests.get(f"{host}/api/v3/{arr.endpoint}").json()]
+            streamed = lambda: list(arr.getAll())
+
+            print(f"{arrClass.__name__}, {size} {arr.endpoint}, {len(body) / 1024 ** 2:.1f}MB response")
+            for name, function in (('full json', full), ('streamed', streamed)):
+                result, seconds, retained, peak = measure(function)
+                assert len(result) == size
+                print(f"  {name:<10} {seconds * 1000:8.0f}ms  retained {retained / 1024 ** 2:7.1f}MB  peak {peak / 1024 ** 2:7.1f}MB")
+                del result
+
+            server.shutdown()
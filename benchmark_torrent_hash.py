@@ -0,0 +1,46 @@
+import argparse
+import hashlib
+import os
+import timeit
+import tracemalloc
+import bencode3
+from shared.torrent import scanTorrent
+
+def buildTorrent(fileCount, pieceCount):
+    files = [{'length': 1024 ** 3 + i, 'path': [f"Season {i // 100 + 1:02d}", f"Show.S{i // 100 + 1:02d}E{i % 100 + 1:02d}.1080p.WEB-DL.mkv"]} for i in range(fileCount)]
+    info = {
+        'files': files,
+        'name': 'Show.Complete.Series.1080p.WEB-DL',
+        'piece length': 4 * 1024 ** 2,
+        'pieces': os.urandom(20 * pieceCount)
+    }
+    return bencode3.bencode({'announce': 'udp://tracker.example.com:80', 'created by': 'benchmark', 'info': info})
+
+def decodeHash(fileData):
+    return hashlib.sha1(bencode3.bencode(bencode3.bdecode(fileData)['info'])).hexdigest()
+
+def scanHash(fileData):
+    return scanTorrent(fileData)[0]
+
+def peakMemory(function, fileData):
+    tracemalloc.start()
+    function(fileData)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare info hash computation by full decode and re-encode against the streaming scanner.')
+    parser.add_argument('--files', type=int, nargs='+', default=[1, 100, 1000, 5000], help='File counts of the generated torrents.')
+    parser.add_argument('--pieces', type=int, default=50000, help='Number of pieces in each generated torrent.')
+    parser.add_argument('--repeat', type=int, default=20, help='Number of runs to time for each implementation.')
+    args = parser.parse_args()
+
+    for fileCount in args.files:
+        fileData = buildTorrent(fileCount, args.pieces)
+        assert decodeHash(fileData) == scanHash(fileData)
+
+        print(f"{fileCount} files, {args.pieces} pieces, {len(fileData) / 1024 ** 2:.1f}MB")
+        for name, function in (('decode/re-encode', decodeHash), ('scan', scanHash)):
+            seconds = min(timeit.repeat(lambda: function(fileData), number=1, repeat=args.repeat))
+            print(f"  {name:<16} {seconds * 1000:8.2f}ms  peak {peakMemory(function, fileData) / 1024 ** 2:6.1f}MB")
@@ -1,23 +1,42 @@
-import shutil
 import time
 import traceback
-import hashlib
 import os
 import sys
 import re
 import requests
 import asyncio
-import bencode3
+import threading
+import heapq
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime
 # import urllib
 from werkzeug.utils import cached_property
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
 from abc import ABC, abstractmethod
 from shared.discord import discordError, discordUpdate
-from shared.shared import realdebrid, blackhole, plex, mediaExtensions, checkRequiredEnvs
+from shared.shared import realdebrid, blackhole, plex, sonarr, radarr, mediaExtensions, checkRequiredEnvs
 from shared.arr import Arr, Radarr, Sonarr
+from shared.torrent import scanTorrent
+from shared.journal import Journal
+from shared.symlinks import LinkPlan, buildLinkPlan, applyLinkPlan, multiSeasonPatternCombined
+from shared.warmup import WarmUp
+from shared.filecopy import copyTree
+from shared.realdebrid import RealDebridAccount, RealDebridPool, InstantAvailability, TorrentRegistry, requestPriority
 
 rdHost = realdebrid['host']
 authToken = realdebrid['apiKey']
+rdApiKeys = [authToken, *realdebrid['additionalApiKeys']]
+rdMountTorrentsPaths = [blackhole['rdMountTorrentsPath'], *blackhole['additionalRdMountTorrentsPaths']]
+if len(rdApiKeys) != len(rdMountTorrentsPaths):
+    raise Exception("Every additional RealDebrid API key needs its own mount torrents path")
+
+journal = Journal(blackhole['journalPath'])
+warmUp = WarmUp() if blackhole['warmUpEnabled'] else None
+# Copies can run for a long time, so they don't take threads from the loop's default executor
+copyExecutor = ThreadPoolExecutor(max_workers=blackhole['copyJobs'], thread_name_prefix='copy')
 
 _print = print
 
@@ -48,11 +67,11 @@ def validateRealdebridApiKey():
     return True
 
 def validateMountTorrentsPath():
-    path = blackhole['rdMountTorrentsPath']
-    if os.path.exists(path) and any(os.path.isdir(os.path.join(path, child)) for child in os.listdir(path)):
-        return True
-    else:
-        return False, "Path does not exist or has no children."
+    for path in rdMountTorrentsPaths:
+        if not (os.path.exists(path) and any(os.path.isdir(os.path.join(path, child)) for child in os.listdir(path))):
+            return False, f"Path {path} does not exist or has no children."
+
+    return True
 
 requiredEnvs = {
     'RealDebrid host': (realdebrid['host'], validateRealdebridHost),
@@ -63,8 +82,21 @@ requiredEnvs = {
     'Blackhole Sonarr path': (blackhole['sonarrPath'],)
 }
 
+# 4K jobs must never fall back to the regular instances
+if blackhole['radarrPath4k']:
+    requiredEnvs['Radarr 4K host'] = (radarr['host4k'],)
+    requiredEnvs['Radarr 4K API key'] = (radarr['apiKey4k'],)
+if blackhole['sonarrPath4k']:
+    requiredEnvs['Sonarr 4K host'] = (sonarr['host4k'],)
+    requiredEnvs['Sonarr 4K API key'] = (sonarr['apiKey4k'],)
+
 checkRequiredEnvs(requiredEnvs)
 
+realDebridPool = RealDebridPool([RealDebridAccount(apiKey, mountTorrentsPath) for apiKey, mountTorrentsPath in zip(rdApiKeys, rdMountTorrentsPaths)])
+# Availability is the same for every account
+instantAvailability = InstantAvailability(realDebridPool.primary.realDebrid)
+torrentRegistry = TorrentRegistry(realDebridPool)
+
 class TorrentFileInfo():
     class FileInfo():
         def __init__(self, filename, filenameWithoutExt, filePath, filePathProcessing, folderPathCompleted, folderPathMountTorrent) -> None:
@@ -80,9 +112,9 @@ class TorrentFileInfo():
             self.isTorrentOrMagnet = isTorrentOrMagnet
             self.isDotTorrentFile = isDotTorrentFile
 
-    def __init__(self, filename, isRadarr) -> None:
+    def __init__(self, filename, isRadarr, is4k=False) -> None:
         print('filename:', filename)
-        baseBath = getPath(isRadarr)
+        baseBath = getPath(isRadarr, is4k=is4k)
         isDotTorrentFile = filename.casefold().endswith('.torrent')
         isTorrentOrMagnet = isDotTorrentFile or filename.casefold().endswith('.magnet')
         filenameWithoutExt, _ = os.path.splitext(filename)
@@ -95,18 +127,31 @@ class TorrentFileInfo():
         self.torrentInfo = self.TorrentInfo(isTorrentOrMagnet, isDotTorrentFile)
         
 
+# RealDebrid error codes for an unsupported, unavailable or busy hoster
+hostErrorCodes = (16, 17, 18, 19, 20)
+
+def isHostError(response):
+    return bool(response) and 'error' in response and (response.get('error_code') in hostErrorCodes or 'hoster' in response['error'])
+
 class TorrentBase(ABC):
-    def __init__(self, f, file, fail, failIfNotCached, onlyLargestFile) -> None:
+    def __init__(self, f, file, fail, failIfNotCached, onlyLargestFile, job=None) -> None:
         super().__init__()
         self.f = f
         self.file = file
+        self.job = job
         self.fail = fail
         self.failIfNotCached = failIfNotCached
         self.onlyLargestFile = onlyLargestFile
         self.id = None
+        self.account = None
         self._info = None
         self._instantAvailability = None
         self._hash = None
+        self._files = None
+        self._selection = None
+        self._registered = False
+        # False when the torrent was submitted by another job or was already in the account
+        self.owner = True
         self.incompatibleHashSize = False
     
     def print(self, *values: object):
@@ -120,27 +165,134 @@ class TorrentBase(ABC):
         return fileData
 
 
-    def submitTorrent(self):
+    async def submitTorrent(self):
+        torrentHash = self.getHash()
+        sharedId, isFirst = torrentRegistry.acquire(torrentHash)
+        self._registered = True
+
+        if not isFirst:
+            shared = await sharedId
+            if shared:
+                self.account, self.id = shared
+                self.owner = False
+                self.print('attached to in-flight torrent:', self.id)
+                return True
+            # The first submission gave up, go through the checks on our own
+        else:
+            journaled = await self.getJournaledTorrent()
+            if journaled:
+                self.account, self.id = journaled
+                self.print('resuming journaled torrent:', self.id)
+                torrentRegistry.resolve(torrentHash, self.account, self.id)
+                return True
+
+            existing = await torrentRegistry.findDownloaded(torrentHash)
+            if existing and await self.coversSelection(*existing):
+                self.account, self.id = existing[0], existing[1]['id']
+                self.owner = False
+                self.print('reusing downloaded torrent:', self.id)
+                torrentRegistry.resolve(torrentHash, self.account, self.id)
+                return True
+
+        submitted = False
+        try:
+            submitted = await self._submitTorrent()
+        finally:
+            torrentRegistry.resolve(torrentHash, self.account, self.id if submitted else None)
+
+        return submitted
+
+    async def _submitTorrent(self):
         if self.failIfNotCached:
-            instantAvailability = self.getInstantAvailability()
+            instantAvailability = await self.getInstantAvailability()
             self.print('instantAvailability:', not not instantAvailability)
             if not instantAvailability:
-                self.fail(self)
+                await self.fail(self)
                 return False
 
-        availableHost = self.getAvailableHost()
-        self.addTorrent(availableHost)
+        # .torrent files list their files, so the selection can be made before RealDebrid has the torrent
+        if self.localFiles:
+            self._selection = await self.getFileSelection(self.localFiles)
+            if not self._selection:
+                await self.fail(self)
+                return False
+
+        # The torrent stays with this account for the rest of its life
+        self.account = await realDebridPool.choose()
+        if len(realDebridPool.accounts) > 1:
+            self.print('account:', self.account.id)
+
+        availableHost = await self.getAvailableHost()
+        addResponse = await self.addTorrent(availableHost)
+        if isHostError(addResponse):
+            # The cached host is stale, look it up again and retry once
+            self.account.availableHosts.invalidate()
+            addResponse = await self.addTorrent(await self.getAvailableHost())
+
+        if not self.id:
+            raise Exception(f"Error adding torrent: {addResponse}")
+        self.account.added()
+
+        # Journaled before the next round trip, so a restart resumes this torrent instead of adding another
+        if self.job:
+            journal.update(self.job, hash=self.getHash(), account=self.account.id, rdId=self.id)
+
+        if self._selection:
+            await self.selectFiles()
+
+        return True
+
+    async def coversSelection(self, account: RealDebridAccount, torrent):
+        # An earlier grab of the same hash may have selected only some of its files, e.g. just the largest
+        info = await account.realDebrid.getInfo(torrent['id'])
+        if not info or 'error' in info:
+            return False
+
+        selection = await self.getFileSelection(info['files'])
+        if not selection:
+            return False
+
+        selected = {str(file['id']) for file in info['files'] if file.get('selected')}
+        missing = set(selection.split(',')) - selected
+        if missing:
+            self.print('downloaded torrent is missing files, adding it again:', torrent['id'], missing)
+            return False
+
         return True
 
     @abstractmethod
     def getHash(self):
         pass
+
+    async def getJournaledTorrent(self):
+        # A job resumed after a restart carries on with the torrent it already added
+        rdId = self.job and self.job['rdId']
+        if not rdId:
+            return None
+
+        account = realDebridPool.getAccount(self.job['account']) if self.job['account'] else realDebridPool.primary
+        if not account:
+            self.print('journaled account no longer configured:', self.job['account'])
+            return None
+
+        info = await account.realDebrid.getInfo(rdId)
+        if not info or 'error' in info:
+            self.print('journaled torrent no longer exists:', rdId)
+            return None
+
+        self._info = info
+        return account, rdId
+
+    @property
+    def localFiles(self):
+        self.getHash()
+        return self._files
     
     @abstractmethod
-    def addTorrent(self, host):
+    async def addTorrent(self, host):
         pass
 
-    def getInstantAvailability(self, refresh=False):
+    async def getInstantAvailability(self, refresh=False):
         if refresh or not self._instantAvailability:
             torrentHash = self.getHash()
             self.print('hash:', torrentHash)
@@ -149,41 +301,48 @@ class TorrentBase(ABC):
                 self.incompatibleHashSize = True
                 return True
 
-            instantAvailabilityRequest = requests.get(f"{rdHost}torrents/instantAvailability/{torrentHash}?auth_token={authToken}")
-            instantAvailabilities = instantAvailabilityRequest.json()
-            self.print('instantAvailabilities:', instantAvailabilities)
-            instantAvailabilityHosters = next(iter(instantAvailabilities.values()))
-            if not instantAvailabilityHosters: return
-
-            self._instantAvailability = next(iter(instantAvailabilityHosters.values()))
+            self._instantAvailability = await instantAvailability.get(torrentHash, refresh)
+            self.print('instantAvailability groups:', self._instantAvailability)
 
         return self._instantAvailability
     
-    def getAvailableHost(self):
-        availableHostsRequest = requests.get(f"{rdHost}torrents/availableHosts?auth_token={authToken}")
-        availableHosts = availableHostsRequest.json()
-
-        return availableHosts[0]['host']
+    async def getAvailableHost(self):
+        return await self.account.availableHosts.get()
     
-    def getInfo(self, refresh=False):
+    async def getInfo(self, refresh=False):
         self._enforceId()
 
         if refresh or not self._info:
-            infoRequest = requests.get(f"{rdHost}torrents/info/{self.id}?auth_token={authToken}")
-            self._info = infoRequest.json()
+            self._info = await self.account.realDebrid.getInfo(self.id)
 
         return self._info
 
-    def selectFiles(self):
+    async def selectFiles(self):
         self._enforceId()
 
-        info = self.getInfo()
-        self.print('files:', info['files'])
-        mediaFiles = [file for file in info['files'] if os.path.splitext(file['path'])[1].lower() in mediaExtensions]
+        if not self.owner:
+            return True
+
+        if not self._selection:
+            info = await self.getInfo()
+            self._selection = await self.getFileSelection(info['files'])
+            if not self._selection:
+                return False
+
+        selectFilesResponse = await self.account.realDebrid.selectFiles(self.id, self._selection)
+        if selectFilesResponse and 'error' in selectFilesResponse:
+            # Picked up again once the poller reports waiting_files_selection
+            self.print('select files error:', selectFilesResponse)
+
+        return True
+
+    async def getFileSelection(self, files):
+        self.print('files:', files)
+        mediaFiles = [file for file in files if os.path.splitext(file['path'])[1].lower() in mediaExtensions]
         
         if not mediaFiles:
             self.print('no media files found')
-            return False
+            return None
 
         mediaFileIds = {str(file['id']) for file in mediaFiles}
         self.print('required fileIds:', mediaFileIds)
@@ -195,25 +354,32 @@ class TorrentBase(ABC):
 
         if self.failIfNotCached and not self.incompatibleHashSize:
             targetFileIds = {largestMediaFileId} if self.onlyLargestFile else mediaFileIds
-            if not any(set(fileGroup.keys()) == targetFileIds for fileGroup in self._instantAvailability):
-                extraFilesGroup = next((fileGroup for fileGroup in self._instantAvailability if largestMediaFileId in fileGroup.keys()), None)
+            fileGroups = await self.getInstantAvailability() or []
+            if not any(set(fileGroup.keys()) == targetFileIds for fileGroup in fileGroups):
+                extraFilesGroup = next((fileGroup for fileGroup in fileGroups if largestMediaFileId in fileGroup.keys()), None)
                 if self.onlyLargestFile and extraFilesGroup:
                     self.print('extra files required for cache:', extraFilesGroup)
                     discordUpdate('Extra files required for cache:', extraFilesGroup)
-                return False
+                return None
             
         if self.onlyLargestFile and len(mediaFiles) > 1:
             discordUpdate('largest file:', largestMediaFile['path'])
                 
-        files = {'files': [largestMediaFileId] if self.onlyLargestFile else ','.join(mediaFileIds)}
-        selectFilesRequest = requests.post(f"{rdHost}torrents/selectFiles/{self.id}?auth_token={authToken}", data=files)
-        
-        return True
+        return largestMediaFileId if self.onlyLargestFile else ','.join(mediaFileIds)
 
-    def delete(self):
+    async def delete(self):
         self._enforceId()
 
-        deleteRequest = requests.delete(f"{rdHost}torrents/delete/{self.id}?auth_token={authToken}")
+        if not self.owner or torrentRegistry.holders(self.getHash()) > 1:
+            self.print('torrent is shared, not deleting:', self.id)
+            return
+
+        await self.account.realDebrid.delete(self.id)
+
+    def release(self):
+        if self._registered:
+            torrentRegistry.release(self.getHash())
+            self._registered = False
 
 
     def _enforceId(self):
@@ -224,17 +390,16 @@ class Torrent(TorrentBase):
     def getHash(self):
 
         if not self._hash:
-            self._hash = hashlib.sha1(bencode3.bencode(bencode3.bdecode(self.fileData)['info'])).hexdigest()
+            self._hash, self._files = scanTorrent(self.fileData)
         
         return self._hash
 
-    def addTorrent(self, host):
-        addTorrentRequest = requests.put(f"{rdHost}torrents/addTorrent?host={host}&auth_token={authToken}", data=self.f)
-        addTorrentResponse = addTorrentRequest.json()
+    async def addTorrent(self, host):
+        addTorrentResponse = await self.account.realDebrid.addTorrent(host, self.fileData)
         self.print('torrent info:', addTorrentResponse)
         
-        self.id = addTorrentResponse['id']
-        return self.id
+        self.id = addTorrentResponse.get('id')
+        return addTorrentResponse
 
 
 class Magnet(TorrentBase):
@@ -246,19 +411,21 @@ class Magnet(TorrentBase):
         
         return self._hash
     
-    def addTorrent(self, host):
-        addMagnetRequest = requests.post(f"{rdHost}torrents/addMagnet?host={host}&auth_token={authToken}", data={'magnet': self.fileData})
-        addMagnetResponse = addMagnetRequest.json()
+    async def addTorrent(self, host):
+        addMagnetResponse = await self.account.realDebrid.addMagnet(host, self.fileData)
         self.print('magnet info:', addMagnetResponse)
         
-        self.id = addMagnetResponse['id']
+        self.id = addMagnetResponse.get('id')
 
-        return self.id
+        return addMagnetResponse
 
-def getPath(isRadarr, create=False):
+def getPath(isRadarr, create=False, is4k=False):
     baseWatchPath = blackhole['baseWatchPath']
     absoluteBaseWatchPath = baseWatchPath if os.path.isabs(baseWatchPath) else os.path.abspath(baseWatchPath)
-    finalPath = os.path.join(absoluteBaseWatchPath, blackhole['radarrPath'] if isRadarr else blackhole['sonarrPath'])
+    if is4k:
+        finalPath = os.path.join(absoluteBaseWatchPath, blackhole['radarrPath4k'] if isRadarr else blackhole['sonarrPath4k'])
+    else:
+        finalPath = os.path.join(absoluteBaseWatchPath, blackhole['radarrPath'] if isRadarr else blackhole['sonarrPath'])
 
     if create:
         for sub_path in ['', 'processing', 'completed']:
@@ -268,22 +435,109 @@ def getPath(isRadarr, create=False):
         
     return finalPath
 
-# From Radarr Radarr/src/NzbDrone.Core/Organizer/FileNameBuilder.cs
-def cleanFileName(name):
-    result = name
-    badCharacters = ["\\", "/", "<", ">", "?", "*", ":", "|", "\""]
-    goodCharacters = ["+", "+", "", "", "!", "-", "", "", ""]
-
-    for i, char in enumerate(badCharacters):
-        result = result.replace(char, goodCharacters[i])
-    
-    return result.strip()
+class MountWatcher():
+    def __init__(self, path: str, pollInterval: float=blackhole['mountPollInterval']) -> None:
+        self.path = path
+        self.pollInterval = pollInterval
+        self.entries = set()
+        self.waiters = {}
+        self._task = None
+        self._refresh = None
+        self._observer = None
+
+    async def waitFor(self, names, timeout):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.waiters[future] = names
+
+        if not self._task or self._task.done():
+            self._refresh = asyncio.Event()
+            self._task = loop.create_task(self._run())
+            self._watch(loop)
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.waiters.pop(future, None)
+
+    def _watch(self, loop):
+        # inotify only fires on some mounts, the periodic listing covers the rest
+        if self._observer:
+            return
+
+        try:
+            handler = FileSystemEventHandler()
+            handler.on_any_event = lambda event: loop.call_soon_threadsafe(self._refresh.set)
+            observer = Observer()
+            observer.daemon = True
+            observer.schedule(handler, self.path)
+            observer.start()
+            self._observer = observer
+        except Exception as e:
+            print('Unable to watch mount, falling back to polling:', e)
+
+    def _list(self):
+        return set(os.listdir(self.path))
+
+    def _hasChildren(self, path):
+        try:
+            return bool(os.listdir(path))
+        except OSError:
+            return False
 
-async def refreshArr(arr: Arr, count=60):
-    # TODO: Change to refresh until found/imported
-    for _ in range(count):
-        arr.refreshMonitoredDownloads()
-        await asyncio.sleep(1)
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self.waiters:
+            try:
+                self.entries = await loop.run_in_executor(None, self._list)
+
+                for future, names in list(self.waiters.items()):
+                    for name in names:
+                        if future.done() or name not in self.entries:
+                            continue
+
+                        path = os.path.join(self.path, name)
+                        if await loop.run_in_executor(None, self._hasChildren, path) and not future.done():
+                            future.set_result(path)
+            except Exception as e:
+                print('Error listing mount:', e)
+
+            self._refresh.clear()
+            try:
+                await asyncio.wait_for(self._refresh.wait(), self.pollInterval)
+            except asyncio.TimeoutError:
+                pass
+
+mountWatchers = {path: MountWatcher(path) for path in rdMountTorrentsPaths}
+
+async def waitForMountFolder(file: TorrentFileInfo, filename, originalFilename, account: RealDebridAccount):
+    mountWatcher = mountWatchers[account.mountTorrentsPath]
+    names = [name for name in (filename, originalFilename) if name]
+    if originalFilename and originalFilename.endswith(('.mkv', '.mp4')):
+        names.append(os.path.splitext(originalFilename)[0])
+
+    start = time.monotonic()
+    timeout = blackhole['waitForTorrentTimeout'] + 1
+    reportAfter = blackhole['rdMountRefreshSeconds'] + 1
+
+    folderPathMountTorrent = await mountWatcher.waitFor(names, min(timeout, reportAfter))
+    if not folderPathMountTorrent and reportAfter < timeout:
+        print(f"Torrent folder not found in filesystem: {file.fileInfo.filenameWithoutExt}")
+        discordError("Torrent folder not found in filesystem", file.fileInfo.filenameWithoutExt)
+        folderPathMountTorrent = await mountWatcher.waitFor(names, timeout - reportAfter)
+
+    existsCount = int(time.monotonic() - start) + 1
+    return folderPathMountTorrent, existsCount
+
+async def refreshArr(arr: Arr, completedFolders=(), count=60):
+    # The arr removes completed folders once imported (Completed Download Handling: Remove Completed)
+    def isImported():
+        return bool(completedFolders) and not any(os.path.exists(folder) for folder in completedFolders)
+
+    await arr.refreshCoordinator.refresh(isImported, count)
+    print('Refresh commands sent:', arr.refreshCoordinator.sent, 'saved:', arr.refreshCoordinator.saved)
 
 def copyFiles(file: TorrentFileInfo, folderPathMountTorrent, arr: Arr):
     # Consider removing this and always streaming
@@ -293,22 +547,25 @@ def copyFiles(file: TorrentFileInfo, folderPathMountTorrent, arr: Arr):
         def print(*values: object):
             _print(f"[{file.fileInfo.filenameWithoutExt}]", *values)
 
-        count = 0
+        deadline = time.monotonic() + blackhole['copyWaitTimeout']
         print('Waiting for arr to delete folders...')
-        while True:
-            count += 1
-            if not os.path.exists(file.fileInfo.folderPathCompleted):
-                print('Deleted')
-                print('Copying actual files to arr folder...')
-                shutil.copytree(folderPathMountTorrent, file.fileInfo.folderPathCompleted)
-                arr.refreshMonitoredDownloads()   
-                print('Copied')          
-                break
+        while os.path.exists(file.fileInfo.folderPathCompleted):
+            if time.monotonic() > deadline:
+                print('Timed out waiting for arr to delete folders')
+                discordError(f"{file.fileInfo.filenameWithoutExt} not copied", f"The arr didn't remove the completed folder within {blackhole['copyWaitTimeout']}s, check that Remove Completed is enabled")
+                return False
             time.sleep(1)
-            if count == 180:
-                print('copyCount > 180')
-                discordError(f"{file.fileInfo.filenameWithoutExt} copy attempt acount > 180", "Shortcut has not finished importing yet")
 
+        print('Deleted')
+        print('Copying actual files to arr folder...')
+        # Copied next to the torrent file first so the arr never sees a partial folder, a failed copy resumes from there
+        folderPathCopying = f"{os.path.splitext(file.fileInfo.filePathProcessing)[0]}.copy"
+        copyStats = copyTree(folderPathMountTorrent, folderPathCopying)
+        os.rename(folderPathCopying, file.fileInfo.folderPathCompleted)
+        print(copyStats.summary())
+        arr.refreshMonitoredDownloads()
+        print('Copied')
+        return True
     except:
         e = traceback.format_exc()
 
@@ -316,179 +573,190 @@ def copyFiles(file: TorrentFileInfo, folderPathMountTorrent, arr: Arr):
         print(e)
 
         discordError(f"Error copying files for {file.fileInfo.filenameWithoutExt}", e)
+        return False
 
 import signal
 
-async def processFile(file: TorrentFileInfo, arr: Arr, isRadarr):
+singleEpisodePattern = re.compile(r'S[\d]{2}E[\d]{2}')
+
+def getPriority(file: TorrentFileInfo, isRadarr):
+    # Lower runs first: single episodes, movies, season packs, then multi-season packs
+    if isRadarr:
+        return 1
+    if multiSeasonPatternCombined.search(file.fileInfo.filenameWithoutExt):
+        return 3
+    if singleEpisodePattern.search(file.fileInfo.filenameWithoutExt):
+        return 0
+    return 2
+
+class PrioritySemaphore():
+    """An asyncio semaphore that lets the most urgent waiter in first."""
+
+    def __init__(self, value: int) -> None:
+        self.value = value
+        self._waiters = []
+        self._sequence = itertools.count()
+
+    async def acquire(self, priority: int):
+        if self.value > 0 and not self._waiters:
+            self.value -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Pass on a permit that was handed over just as we were cancelled
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+
+        self.value += 1
+
+    @asynccontextmanager
+    async def hold(self, priority: int):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+linkStage = PrioritySemaphore(blackhole['symlinkJobs'])
+
+async def processFile(file: TorrentFileInfo, arr: Arr, isRadarr, is4k=False, waiting: asyncio.Event=None):
+    torrent = None
+    job = None
     try:
+        job = journal.startJob(file.fileInfo.filePathProcessing, isRadarr, is4k)
         _print = globals()['print']
 
         def print(*values: object):
             _print(f"[{file.fileInfo.filenameWithoutExt}]", *values)
 
-        from concurrent.futures import ThreadPoolExecutor
-
-        def read_file(path):
-            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-                f.read(1)
-
-        async def is_accessible(path, timeout=10):
-            with ThreadPoolExecutor() as executor:
-                loop = asyncio.get_event_loop()
-                try:
-                    await asyncio.wait_for(loop.run_in_executor(executor, read_file, path), timeout=timeout)
-                    discordUpdate('good')
-                    return True
-                except Exception as e:
-                    discordError('error', e)
-                    return False
-                finally:
-                    executor.shutdown(wait=False)
-
         with open(file.fileInfo.filePathProcessing, 'rb' if file.torrentInfo.isDotTorrentFile else 'r') as f:
-            def fail(torrent: TorrentBase, arr: Arr=arr):
+            async def fail(torrent: TorrentBase, arr: Arr=arr):
                 print(f"Failing")
 
-                history = arr.getHistory(blackhole['historyPageSize'])['records']
-                items = (item for item in history if item['data'].get('torrentInfoHash', '').casefold() == torrent.getHash().casefold() or cleanFileName(item['sourceTitle'].casefold()) == torrent.file.fileInfo.filenameWithoutExt.casefold())
+                historyIndex = arr.getHistoryIndex(blackhole['historyPageSize'])
+                items = await asyncio.get_running_loop().run_in_executor(None, historyIndex.find, torrent.getHash(), torrent.file.fileInfo.filenameWithoutExt)
                 
                 if not items:
                     raise Exception("No history items found to cancel")
                 
                 for item in items:
                     # TODO: See if we can fail without blacklisting as cached items constantly changes
-                    arr.failHistoryItem(item['id'])
+                    await asyncio.get_running_loop().run_in_executor(None, arr.failHistoryItem, item['id'])
+                journal.update(job, status='failed')
                 print(f"Failed")
 
-            onlyLargestFile = isRadarr or bool(re.search(r'S[\d]{2}E[\d]{2}', file.fileInfo.filename))
+            onlyLargestFile = isRadarr or bool(singleEpisodePattern.search(file.fileInfo.filename))
             if file.torrentInfo.isDotTorrentFile:
-                torrent = Torrent(f, file, fail, blackhole['failIfNotCached'], onlyLargestFile)
+                torrent = Torrent(f, file, fail, blackhole['failIfNotCached'], onlyLargestFile, job)
             else:
-                torrent = Magnet(f, file, fail, blackhole['failIfNotCached'], onlyLargestFile)
+                torrent = Magnet(f, file, fail, blackhole['failIfNotCached'], onlyLargestFile, job)
             
-            if torrent.submitTorrent():
-                count = 0
-                while True:
-                    count += 1
-                    info = torrent.getInfo(refresh=True)
-                    status = info['status']
+            if await torrent.submitTorrent():
+                journal.update(job, hash=torrent.getHash(), account=torrent.account.id, rdId=torrent.id, status='submitted')
+                # Updates arrive at the poller's interval, which backs off, so the timeout is measured in seconds
+                start = time.monotonic()
+                reported = False
+                torrentPoller = torrent.account.torrentPoller
+                torrentInfoUpdates = torrentPoller.subscribe(torrent.id)
+                # Waiting for RealDebrid and the mount doesn't need a worker, let the next file be submitted
+                if waiting:
+                    waiting.set()
+                try:
+                    while True:
+                        info = await torrentInfoUpdates.get()
+                        status = info['status']
                     
-                    print('status:', status)
+                        print('status:', status)
+                        journal.update(job, status=status)
 
-                    if status == 'waiting_files_selection':
-                        if not torrent.selectFiles():
-                            torrent.delete()
-                            fail(torrent)
-                            break
-                    elif status == 'magnet_conversion' or status == 'queued' or status == 'downloading' or status == 'compressing' or status == 'uploading':
-                        # Send progress to arr
-                        progress = info['progress']
-                        print(progress)
-                        if torrent.incompatibleHashSize and torrent.failIfNotCached:
-                            print("Non-cached incompatible hash sized torrent")
-                            torrent.delete()
-                            fail(torrent)
+                        if status == 'waiting_files_selection':
+                            if not await torrent.selectFiles():
+                                await torrent.delete()
+                                await fail(torrent)
+                                break
+                        elif status == 'magnet_conversion' or status == 'queued' or status == 'downloading' or status == 'compressing' or status == 'uploading':
+                            # Send progress to arr
+                            progress = info['progress']
+                            print(progress)
+                            if torrent.incompatibleHashSize and torrent.failIfNotCached:
+                                print("Non-cached incompatible hash sized torrent")
+                                await torrent.delete()
+                                await fail(torrent)
+                                break
+                        elif status == 'magnet_error' or status == 'error' or status == 'dead' or status == 'virus':
+                            await fail(torrent)
                             break
-                        await asyncio.sleep(1)
-                    elif status == 'magnet_error' or status == 'error' or status == 'dead' or status == 'virus':
-                        fail(torrent)
-                        break
-                    elif status == 'downloaded':
-                        existsCount = 0
-                        print('Waiting for folders to refresh...')
-
-                        filename = info.get('filename')
-                        originalFilename = info.get('original_filename')
-
-                        folderPathMountFilenameTorrent = os.path.join(blackhole['rdMountTorrentsPath'], filename)
-                        folderPathMountOriginalFilenameTorrent = os.path.join(blackhole['rdMountTorrentsPath'], originalFilename)
-                        folderPathMountOriginalFilenameWithoutExtTorrent = os.path.join(blackhole['rdMountTorrentsPath'], os.path.splitext(originalFilename)[0])
-
-                        while existsCount <= blackhole['waitForTorrentTimeout']:
-                            existsCount += 1
-                           
-                            if os.path.exists(folderPathMountFilenameTorrent) and os.listdir(folderPathMountFilenameTorrent):
-                                folderPathMountTorrent = folderPathMountFilenameTorrent
-                            elif os.path.exists(folderPathMountOriginalFilenameTorrent) and os.listdir(folderPathMountOriginalFilenameTorrent):
-                                folderPathMountTorrent = folderPathMountOriginalFilenameTorrent
-                            elif (originalFilename.endswith(('.mkv', '.mp4')) and
-                                  os.path.exists(folderPathMountOriginalFilenameWithoutExtTorrent) and os.listdir(folderPathMountOriginalFilenameWithoutExtTorrent)):
-                                folderPathMountTorrent = folderPathMountOriginalFilenameWithoutExtTorrent
+                        elif status == 'downloaded':
+                            print('Waiting for folders to refresh...')
+                            torrentPoller.unsubscribe(torrent.id, torrentInfoUpdates)
+
+                            # The torrent list doesn't include the original filename
+                            info = await torrent.getInfo(refresh=True)
+
+                            filename = info.get('filename')
+                            originalFilename = info.get('original_filename')
+
+                            folderPathMountTorrent, existsCount = await waitForMountFolder(file, filename, originalFilename, torrent.account)
+                            if not folderPathMountTorrent:
+                                journal.update(job, error='Mount folder not found')
                             else:
-                                folderPathMountTorrent = None
-
-                            if folderPathMountTorrent:
-                                multiSeasonRegex1 = r'(?<=[\W_][Ss]eason[\W_])[\d][\W_][\d]{1,2}(?=[\W_])'
-                                multiSeasonRegex2 = r'(?<=[\W_][Ss])[\d]{2}[\W_][Ss]?[\d]{2}(?=[\W_])'
-                                multiSeasonRegexCombined = f'{multiSeasonRegex1}|{multiSeasonRegex2}'
-
-                                multiSeasonMatch = re.search(multiSeasonRegexCombined, file.fileInfo.filenameWithoutExt)
-
-                                for root, dirs, files in os.walk(folderPathMountTorrent):
-                                    relRoot = os.path.relpath(root, folderPathMountTorrent)
-                                    for filename in files:
-                                        # Check if the file is accessible
-                                        # if not await is_accessible(os.path.join(root, filename)):
-                                        #     print(f"Timeout reached when accessing file: {filename}")
-                                        #     discordError(f"Timeout reached when accessing file", filename)
-                                            # Uncomment the following line to fail the entire torrent if the timeout on any of its files are reached
-                                            # fail(torrent)
-                                            # return
-                                        
-                                        if multiSeasonMatch:
-                                            seasonMatch = re.search(r'S([\d]{2})E[\d]{2}', filename)
-                                            
-                                            if seasonMatch:
-                                                season = seasonMatch.group(1)
-                                                seasonShort = season[1:] if season[0] == '0' else season
-
-                                                seasonFolderPathCompleted = re.sub(multiSeasonRegex1, seasonShort, file.fileInfo.folderPathCompleted)
-                                                seasonFolderPathCompleted = re.sub(multiSeasonRegex2, season, seasonFolderPathCompleted)
-
-                                                os.makedirs(os.path.join(seasonFolderPathCompleted, relRoot), exist_ok=True)
-                                                os.symlink(os.path.join(root, filename), os.path.join(seasonFolderPathCompleted, relRoot, filename))
-                                                print('Season Recursive:', f"{os.path.join(seasonFolderPathCompleted, relRoot, filename)} -> {os.path.join(root, filename)}")
-                                                # refreshEndpoint = f"{plex['serverHost']}/library/sections/{plex['serverMovieLibraryId'] if isRadarr else plex['serverTvShowLibraryId']}/refresh?path={urllib.parse.quote_plus(os.path.join(seasonFolderPathCompleted, relRoot))}&X-Plex-Token={plex['serverApiKey']}"
-                                                # cancelRefreshRequest = requests.delete(refreshEndpoint, headers={'Accept': 'application/json'})
-                                                # refreshRequest = requests.get(refreshEndpoint, headers={'Accept': 'application/json'})
-
-                                                continue
-
-
-                                        os.makedirs(os.path.join(file.fileInfo.folderPathCompleted, relRoot), exist_ok=True)
-                                        os.symlink(os.path.join(root, filename), os.path.join(file.fileInfo.folderPathCompleted, relRoot, filename))
-                                        print('Recursive:', f"{os.path.join(file.fileInfo.folderPathCompleted, relRoot, filename)} -> {os.path.join(root, filename)}")
-                                        # refreshEndpoint = f"{plex['serverHost']}/library/sections/{plex['serverMovieLibraryId'] if isRadarr else plex['serverTvShowLibraryId']}/refresh?path={urllib.parse.quote_plus(os.path.join(file.fileInfo.folderPathCompleted, relRoot))}&X-Plex-Token={plex['serverApiKey']}"
-                                        # cancelRefreshRequest = requests.delete(refreshEndpoint, headers={'Accept': 'application/json'})
-                                        # refreshRequest = requests.get(refreshEndpoint, headers={'Accept': 'application/json'})
-                                
+                                journal.update(job, mountFolder=folderPathMountTorrent)
+                                loop = asyncio.get_running_loop()
+                                async with linkStage.hold(requestPriority.get()):
+                                    linkPlan = await loop.run_in_executor(None, buildLinkPlan, folderPathMountTorrent, os.path.dirname(file.fileInfo.folderPathCompleted), file.fileInfo.filenameWithoutExt)
+
+                                # The arr imports as soon as it sees the links, so they are only created once the files are warm
+                                if warmUp and not await warmUpFiles(linkPlan, job, print):
+                                    await fail(torrent)
+                                    break
+
+                                journal.update(job, status='linking')
+                                async with linkStage.hold(requestPriority.get()):
+                                    await loop.run_in_executor(None, applyLinkPlan, linkPlan)
+                                journal.addSymlinks(job, linkPlan.created + linkPlan.skipped)
+                                completedFolders = linkPlan.completedFolders
+                                print(linkPlan.summary())
+
                                 print('Refreshed')
                                 discordUpdate(f"Sucessfully processed {file.fileInfo.filenameWithoutExt}", f"Now available for immediate consumption! existsCount: {existsCount}")
-                                
+                            
                                 # refreshEndpoint = f"{plex['serverHost']}/library/sections/{plex['serverMovieLibraryId'] if isRadarr else plex['serverTvShowLibraryId']}/refresh?X-Plex-Token={plex['serverApiKey']}"
                                 # cancelRefreshRequest = requests.delete(refreshEndpoint, headers={'Accept': 'application/json'})
                                 # refreshRequest = requests.get(refreshEndpoint, headers={'Accept': 'application/json'})
-                                await refreshArr(arr)
+                                await refreshArr(arr, completedFolders)
 
-                                # await asyncio.get_running_loop().run_in_executor(None, copyFiles, file, folderPathMountTorrent, arr)
-                                break
-                            
-                            if existsCount == blackhole['rdMountRefreshSeconds'] + 1:
-                                print(f"Torrent folder not found in filesystem: {file.fileInfo.filenameWithoutExt}")
-                                discordError("Torrent folder not found in filesystem", file.fileInfo.filenameWithoutExt)
-
-                            await asyncio.sleep(1)
-                        break
-                
-                    if torrent.failIfNotCached:
-                        if count == 21:
-                            print('infoCount > 20')
-                            discordError(f"{file.fileInfo.filenameWithoutExt} info attempt count > 20", status)
-                        elif count == blackhole['waitForTorrentTimeout']:
-                            print('infoCount == 60 - Failing')
-                            fail(torrent)
+                                if blackhole['radarrCopy' if isRadarr else 'sonarrCopy']:
+                                    if not await loop.run_in_executor(copyExecutor, copyFiles, file, folderPathMountTorrent, arr):
+                                        # The links are already imported, so the job still completes
+                                        journal.update(job, error='Files not copied')
                             break
+                
+                        if torrent.failIfNotCached:
+                            elapsed = time.monotonic() - start
+                            if blackhole['waitForTorrentTimeout'] and elapsed >= blackhole['waitForTorrentTimeout']:
+                                print(f"Not downloaded after {elapsed:.0f}s - Failing")
+                                await fail(torrent)
+                                break
+                            elif elapsed > 20 and not reported:
+                                reported = True
+                                print('Not downloaded after 20s')
+                                discordError(f"{file.fileInfo.filenameWithoutExt} not downloaded after 20s", status)
+                finally:
+                    torrentPoller.unsubscribe(torrent.id, torrentInfoUpdates)
 
+            journal.update(job, status='completed' if job['status'] == 'linking' else 'failed')
             os.remove(file.fileInfo.filePathProcessing)
     except:
         e = traceback.format_exc()
@@ -498,48 +766,201 @@ async def processFile(file: TorrentFileInfo, arr: Arr, isRadarr):
 
         discordError(f"Error processing {file.fileInfo.filenameWithoutExt}", e)
 
-def getFiles(isRadarr):
+        # The file stays in processing/ and is resumed on the next start
+        if job:
+            journal.update(job, status='error', error=e)
+    finally:
+        if torrent:
+            torrent.release()
+
+async def warmUpFiles(linkPlan: LinkPlan, job, print=print):
+    paths = [target for _, target in linkPlan.links if os.path.splitext(target)[1].lower() in mediaExtensions]
+
+    journal.update(job, status='warming')
+    results = await warmUp.probe(paths)
+    journal.addWarmUps(job, results)
+
+    failed = [result for result in results if not result['ok']]
+    slowest = max((result['seconds'] for result in results), default=0)
+    print(f"Warmed up {len(results) - len(failed)}/{len(results)} files, slowest {slowest:.2f}s")
+
+    if failed:
+        discordError(f"Warm-up failed for {len(failed)} files", '\n'.join(f"{result['path']}: {result['error']}" for result in failed))
+        return blackhole['warmUpPolicy'] != 'fail'
+
+    return True
+
+def getTorrentHashes(files):
+    torrentHashes = []
+    for file in files:
+        try:
+            with open(file.fileInfo.filePathProcessing, 'rb' if file.torrentInfo.isDotTorrentFile else 'r') as f:
+                torrent = Torrent(f, file, None, False, False) if file.torrentInfo.isDotTorrentFile else Magnet(f, file, None, False, False)
+                torrentHash = torrent.getHash()
+        except Exception as e:
+            # processFile reports unreadable files itself
+            continue
+
+        if len(torrentHash) == 40:
+            torrentHashes.append(torrentHash)
+
+    return torrentHashes
+
+def getFiles(isRadarr, is4k=False):
     print('getFiles')
-    files = (TorrentFileInfo(filename, isRadarr) for filename in os.listdir(getPath(isRadarr)) if filename not in ['processing', 'completed'])
+    files = (TorrentFileInfo(filename, isRadarr, is4k) for filename in os.listdir(getPath(isRadarr, is4k=is4k)) if filename not in ['processing', 'completed'])
     return [file for file in files if file.torrentInfo.isTorrentOrMagnet]
 
-async def on_created(isRadarr):
-    print("Enter 'on_created'")
-    try:
-        print('radarr/sonarr:', 'radarr' if isRadarr else 'sonarr')
+def getProcessingFiles(isRadarr, is4k=False):
+    processingPath = os.path.join(getPath(isRadarr, is4k=is4k), 'processing')
+    if not os.path.isdir(processingPath):
+        return []
 
-        if isRadarr:
-            arr = Radarr()
-        else:
-            arr = Sonarr()
+    files = (TorrentFileInfo(filename, isRadarr, is4k) for filename in os.listdir(processingPath))
+    return [file for file in files if file.torrentInfo.isTorrentOrMagnet]
 
-        futures: list[asyncio.Future] = []
-        firstGo = True
-        
-        # Consider switching to a queue
-        while firstGo or not all(future.done() for future in futures):
-            files = getFiles(isRadarr)
-            if files:
-                for file in files:
-                    os.renames(file.fileInfo.filePath, file.fileInfo.filePathProcessing)
-                futures.append(asyncio.gather(*(processFile(file, arr, isRadarr) for file in files)))
-            elif firstGo:
+class Scheduler():
+    def __init__(self, workers: int=blackhole['workers'], debounceSeconds: float=blackhole['debounceSeconds']) -> None:
+        self.workers = workers
+        self.debounceSeconds = debounceSeconds
+        self.loop = None
+        self.queue = None
+        self.arrs = {}
+        self._thread = None
+        self._pendingScans = {}
+        self._resumed = set()
+        # Jobs handed off by their worker while they wait for RealDebrid
+        self._waitingJobs = set()
+        # Keeps files of equal priority in the order they were found
+        self._sequence = itertools.count()
+
+    def start(self):
+        if self._thread:
+            return
+
+        self.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ready,), name='blackhole', daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def _run(self, ready: threading.Event):
+        asyncio.set_event_loop(self.loop)
+        self.queue = asyncio.PriorityQueue()
+        for _ in range(self.workers):
+            self.loop.create_task(self._worker())
+
+        self.loop.call_soon(ready.set)
+        self.loop.run_forever()
+
+    def getArr(self, isRadarr, is4k=False):
+        key = (isRadarr, is4k)
+        if key not in self.arrs:
+            if is4k:
+                host, apiKey = (radarr['host4k'], radarr['apiKey4k']) if isRadarr else (sonarr['host4k'], sonarr['apiKey4k'])
+                if not host or not apiKey:
+                    raise Exception(f"{'Radarr' if isRadarr else 'Sonarr'} 4K host and API key must be set to process 4K files")
+                self.arrs[key] = Radarr(host, apiKey) if isRadarr else Sonarr(host, apiKey)
+            else:
+                self.arrs[key] = Radarr() if isRadarr else Sonarr()
+
+        return self.arrs[key]
+
+    def enqueueFiles(self, isRadarr, is4k=False):
+        return asyncio.run_coroutine_threadsafe(self.scan(isRadarr, is4k), self.loop)
+
+    def requestScan(self, isRadarr, is4k=False):
+        # Safe to call from any thread, e.g. the watchdog observer
+        self.loop.call_soon_threadsafe(self._debounceScan, isRadarr, is4k)
+
+    def _debounceScan(self, isRadarr, is4k):
+        key = (isRadarr, is4k)
+        if key not in self._pendingScans:
+            self._pendingScans[key] = self.loop.call_later(self.debounceSeconds, self._startScan, isRadarr, is4k)
+
+    def _startScan(self, isRadarr, is4k):
+        # Cleared before listing so any event arriving after this point schedules another scan
+        del self._pendingScans[(isRadarr, is4k)]
+        self.loop.create_task(self.scan(isRadarr, is4k))
+
+    def join(self):
+        asyncio.run_coroutine_threadsafe(self.queue.join(), self.loop).result()
+
+    def _collect(self, isRadarr, is4k, resume):
+        # Files left in processing/ by a previous run are picked up once, on the first scan
+        resumedFiles = []
+        if resume:
+            resumedFiles = getProcessingFiles(isRadarr, is4k)
+            if resumedFiles:
+                print('Resuming', len(resumedFiles), 'files from processing')
+
+        newFiles = getFiles(isRadarr, is4k)
+
+        # Files are only enqueued once, the rename takes them out of the next listing
+        for file in newFiles:
+            os.renames(file.fileInfo.filePath, file.fileInfo.filePathProcessing)
+
+        files = resumedFiles + newFiles
+        return files, getTorrentHashes(files) if files and blackhole['failIfNotCached'] else []
+
+    async def scan(self, isRadarr, is4k=False):
+        try:
+            print('radarr/sonarr:', 'radarr' if isRadarr else 'sonarr', '4k' if is4k else '')
+
+            resume = (isRadarr, is4k) not in self._resumed
+            self._resumed.add((isRadarr, is4k))
+
+            # Listing, renaming and hashing a large drop of files would stall every job on the loop
+            files, torrentHashes = await self.loop.run_in_executor(None, self._collect, isRadarr, is4k, resume)
+            if not files:
                 print('No torrent files found')
-            firstGo = False
-            await asyncio.sleep(1)
+                return
 
-        await asyncio.gather(*futures)
-    except:
-        e = traceback.format_exc()
+            instantAvailability.prefetch(torrentHashes)
 
-        print(f"Error processing")
-        print(e)
+            for file in files:
+                self.queue.put_nowait((getPriority(file, isRadarr), next(self._sequence), file, isRadarr, is4k))
+        except:
+            e = traceback.format_exc()
+
+            print(f"Error processing")
+            print(e)
 
-        discordError(f"Error processing", e)
-    print("Exit 'on_created'")
+            discordError(f"Error processing", e)
 
-def start(isRadarr):
-    asyncio.run(on_created(isRadarr))
+    async def _worker(self):
+        while True:
+            priority, _, file, isRadarr, is4k = await self.queue.get()
+            # Read by the RealDebrid rate limiter and the link stage
+            requestPriority.set(priority)
+            try:
+                arr = self.getArr(isRadarr, is4k)
+            except Exception as e:
+                # The file stays in processing/ and is resumed on the next start
+                print(f"Error processing {file.fileInfo.filenameWithoutExt}:", e)
+                discordError(f"Error processing {file.fileInfo.filenameWithoutExt}", str(e))
+                self.queue.task_done()
+                continue
+
+            waiting = asyncio.Event()
+            job = self.loop.create_task(processFile(file, arr, isRadarr, is4k, waiting))
+            # join() returns once every job has finished, not just left its worker
+            job.add_done_callback(lambda job: self.queue.task_done())
+
+            waited = self.loop.create_task(waiting.wait())
+            await asyncio.wait({job, waited}, return_when=asyncio.FIRST_COMPLETED)
+            waited.cancel()
+
+            if not job.done():
+                self._waitingJobs.add(job)
+                job.add_done_callback(self._waitingJobs.discard)
+
+scheduler = Scheduler()
+
+def start(isRadarr, is4k=False):
+    scheduler.start()
+    return scheduler.enqueueFiles(isRadarr, is4k)
 
 if __name__ == "__main__":
-    start(isRadarr=sys.argv[1] == 'radarr')
+    start(isRadarr=sys.argv[1] == 'radarr').result()
+    scheduler.join()
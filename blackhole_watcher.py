@@ -1,41 +1,51 @@
+import os
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from blackhole import start, getPath
+from shared.shared import blackhole
+from blackhole import scheduler, getPath
 
 class BlackholeHandler(FileSystemEventHandler):
-    def __init__(self, is_radarr):
+    def __init__(self, is_radarr, is_4k=False):
         super().__init__()
-        self.is_processing = False
         self.is_radarr = is_radarr
-        self.path_name = getPath(is_radarr, create=True)
+        self.is_4k = is_4k
+        self.path_name = getPath(is_radarr, create=True, is4k=is_4k)
 
     def on_created(self, event):
-        if not self.is_processing and not event.is_directory and event.src_path.lower().endswith((".torrent", ".magnet")):
-            self.is_processing = True
-            try:
-                start(self.is_radarr)
-            finally:
-                self.is_processing = False
+        self.forward(event, event.src_path)
+
+    def on_moved(self, event):
+        self.forward(event, event.dest_path)
+
+    def forward(self, event, path):
+        # Never block the observer thread, the scheduler debounces and scans on its own loop
+        # Moves into processing/ are the scheduler's own renames and are ignored
+        if not event.is_directory and os.path.dirname(path) == self.path_name and path.lower().endswith((".torrent", ".magnet")):
+            scheduler.requestScan(self.is_radarr, self.is_4k)
 
 
 if __name__ == "__main__":
     print("Watching blackhole")
 
-    radarr_handler = BlackholeHandler(is_radarr=True)
-    sonarr_handler = BlackholeHandler(is_radarr=False)
+    scheduler.start()
 
-    radarr_observer = Observer()
-    radarr_observer.schedule(radarr_handler, radarr_handler.path_name)
+    handlers = [BlackholeHandler(is_radarr=True), BlackholeHandler(is_radarr=False)]
+    if blackhole['radarrPath4k']:
+        handlers.append(BlackholeHandler(is_radarr=True, is_4k=True))
+    if blackhole['sonarrPath4k']:
+        handlers.append(BlackholeHandler(is_radarr=False, is_4k=True))
 
-    sonarr_observer = Observer()
-    sonarr_observer.schedule(sonarr_handler, sonarr_handler.path_name)
+    observer = Observer()
+    for handler in handlers:
+        observer.schedule(handler, handler.path_name)
+        # Pick up anything dropped while the watcher wasn't running
+        scheduler.requestScan(handler.is_radarr, handler.is_4k)
 
+    observer.start()
     try:
-        radarr_observer.start()
-        sonarr_observer.start()
+        while observer.is_alive():
+            observer.join(1)
     except KeyboardInterrupt:
-        radarr_observer.stop()
-        sonarr_observer.stop()
+        observer.stop()
 
-    radarr_observer.join()
-    sonarr_observer.join()
+    observer.join()
@@ -4,15 +4,20 @@ src_dir = '/path/to/src/'
 dst_dir = '/path/to/dst/'
 
 def moveMedia(arr: Arr):
-    items = arr.getAll()
+    mirror = arr.getMirror()
+    mirror.sync()
+    items = mirror.getAll()
 
     for item in items:
         if item.path.startswith(dst_dir):
             continue
 
+        # The mirror's copy can be older than the last change made in the arr
+        item = arr.get(item.id)
         print(f"Moving {item.title} - {item.size/1073741824}GB")
         item.path = item.path.replace(src_dir, dst_dir)
         arr.put(item)
+        mirror.refresh([item.id])
         break
 
 
@@ -4,6 +4,7 @@ import requests
 from datetime import datetime
 from shared.shared import sonarr, radarr, overseerr, tautulli, trakt
 from shared.discord import discordUpdate, discordError
+from shared.arr import Sonarr, Radarr
 import FsQuota
 
 tautulliHost = tautulli['host']
@@ -20,6 +21,11 @@ overseerrAPIkey = overseerr['apiKey']
 
 traktAPIkey = trakt['apiKey']
 
+radarrArr = Radarr()
+radarrMirror = radarrArr.getMirror()
+sonarrArr = Sonarr()
+sonarrMirror = sonarrArr.getMirror()
+
 # This is the section ID for movies in your Tautulli config
 tautulliMovieSectionID = "1"
 
@@ -60,28 +66,27 @@ print(datetime.now().isoformat())
 def purgeMovie(movie, movieTatulli):
   deletesize = 0
 
-  f = requests.get(f"{radarrHost}/api/v3/movie?apiKey={radarrAPIkey}")
   try:
    guids = movieTatulli['guids']
    tmdbId = next(guid[len('tmdb://'):] for guid in guids if guid.startswith('tmdb://'))
    
-   r = requests.get(f"{radarrHost}/api/v3/movie/lookup?apiKey={radarrAPIkey}&term=tmdb:{tmdbId}")
-   radarr = r.json()[0]
+   radarr = radarrMirror.findByTmdbId(tmdbId)
 
-   if radarrTagID in radarr['tags']and round((today - int(movie['added_at']))/86400) <= daysToIngoreTags:
-    # print("SKIPPED: " + movie['title'] + " | Added at: " +  datetime.fromtimestamp(int(movie['added_at'])).isoformat() + " | Radarr ID: " + str(radarr['id']) + " | TMDB ID: " + str(radarr['tmdbId']))
+   if radarrTagID in radarrMirror.getTags(radarr.id) and round((today - int(movie['added_at']))/86400) <= daysToIngoreTags:
+    # print("SKIPPED: " + movie['title'] + " | Added at: " +  datetime.fromtimestamp(int(movie['added_at'])).isoformat() + " | Radarr ID: " + str(radarr.id) + " | TMDB ID: " + str(tmdbId))
     pass
    else:
     if not dryRun:
-      response = requests.delete(f"{radarrHost}/api/v3/movie/" + str(radarr['id']) + f"?apiKey={radarrAPIkey}&deleteFiles=true")
+      response = requests.delete(f"{radarrHost}/api/v3/movie/" + str(radarr.id) + f"?apiKey={radarrAPIkey}&deleteFiles=true")
+      radarrMirror.refresh([radarr.id])
 
     headers = {"X-Api-Key": f"{overseerrAPIkey}"}
-    o = requests.get(f"{overseerrHost}/api/v1/movie/" + str(radarr['tmdbId']), headers=headers)
+    o = requests.get(f"{overseerrHost}/api/v1/movie/" + str(tmdbId), headers=headers)
     overseerr = json.loads(o.text)
     if overseerr.get('mediaInfo', False):
       o = requests.delete(f"{overseerrHost}/api/v1/media/" + str(overseerr['mediaInfo']['id']), headers=headers)
 
-    print("DELETED: " + movie['title'] + " | Radarr ID: " + str(radarr['id']) + " | TMDB ID: " + str(radarr['tmdbId']))
+    print("DELETED: " + movie['title'] + " | Radarr ID: " + str(radarr.id) + " | TMDB ID: " + str(tmdbId))
     deletesize = (int(movie['file_size'])/1073741824)
   except Exception as e:
    print("ERROR: " + movie['title'] + ": " + repr(e))
@@ -91,14 +96,11 @@ def purgeMovie(movie, movieTatulli):
 def purgeSeason(season, tautulliShow):
   deletesize = 0
 
-# Remove the below?
-  f = requests.get(f"{sonarrHost}/api/v3/series?apiKey={sonarrAPIkey}")
   try:
    guids = tautulliShow['guids']
    tvdbId = next(guid[len('tvdb://'):] for guid in guids if guid.startswith('tvdb://'))
       
-   s = requests.get(f"{sonarrHost}/api/v3/series/lookup?apiKey={sonarrAPIkey}&term=tvdb:{tvdbId}")
-   show = s.json()[0]
+   show = sonarrMirror.findByTvdbId(tvdbId)
 
    headers = {
      "trakt-api-key": f"{traktAPIkey}",
@@ -107,29 +109,32 @@ def purgeSeason(season, tautulliShow):
    t = requests.get(f"https://api.trakt.tv/search/tvdb/{tvdbId}?type=show", headers=headers)
    trakt = json.loads(t.text)
 
-   f = requests.get(f"{sonarrHost}/api/v3/episode?apiKey={sonarrAPIkey}&seriesId={show['id']}")
-   episodes = f.json()
+   # Live, the files to delete are decided from them
+   episodes = sonarrArr.getEpisodes(show.id)
 
    for episode in episodes:
     if str(episode['seasonNumber']) != season['media_index'] or not episode['episodeFileId']: 
       # print("SKIPPED: " + season['parent_title'] + " - " + episode['title'] +  " | Sonarr ID: " + str(episode['id']) + " | TVDB ID: " + str(episode['tvdbId']))
       continue
-    if episode['seasonNumber'] == 1 and episode['episodeNumber'] == 1 and radarrTagID in show['tags'] and round((today - int(season['added_at']))/86400) <= daysToIngoreTags:
+    if episode['seasonNumber'] == 1 and episode['episodeNumber'] == 1 and radarrTagID in sonarrMirror.getTags(show.id) and round((today - int(season['added_at']))/86400) <= daysToIngoreTags:
       # print("SKIPPED: " + season['parent_title'] + " - " + episode['title'] + " | Added at: " +  datetime.fromtimestamp(int(season['added_at'])).isoformat() + " | Sonarr ID: " + str(episode['id']) + " | TVDB ID: " + str(episode['tvdbId']))
       continue
      
-    episodeFile = requests.get(f"{sonarrHost}/api/v3/episodefile/{episode['episodeFileId']}?apiKey={sonarrAPIkey}").json()
+    episodeFile = sonarrMirror.getFile(episode['episodeFileId'])
+    episodeSize = episodeFile.size if episodeFile else requests.get(f"{sonarrHost}/api/v3/episodefile/{episode['episodeFileId']}?apiKey={sonarrAPIkey}").json()['size']
     if not dryRun:
       response = requests.delete(f"{sonarrHost}/api/v3/episodefile/{episode['episodeFileId']}?apiKey={sonarrAPIkey}")
 
     print("DELETED: " + season['parent_title'] + " - " + episode['title'] + " | Sonarr ID: " + str(episode['id']) + " | TVDB ID: " + str(episode['tvdbId']))
 
-    deletesize += (int(episodeFile['size'])/1073741824)
+    deletesize += (int(episodeSize)/1073741824)
 
-   seasonInfo = next(seasonInfo for seasonInfo in show['seasons'] if str(seasonInfo['seasonNumber']) == season['media_index'])
-   seasonInfo['monitored'] = False
+   # The mirror's monitoring can be older than the last change made in Sonarr
+   show = sonarrArr.get(show.id)
+   show.setChildMonitored(int(season['media_index']), False)
 
-   response = requests.put(f"{sonarrHost}/api/v3/series/{show['id']}?apiKey={sonarrAPIkey}", json=show)
+   sonarrArr.put(show)
+   sonarrMirror.refresh([show.id])
 
    headers = {"X-Api-Key": f"{overseerrAPIkey}"}
 
@@ -158,6 +163,11 @@ else:
   print(f"Running. Remaining space: {remaining}GB. Minimum alllowed space: {minSpace}GB")  
   totalsize = 0
 
+  # Without a saved mirror, a lookup per title is cheaper than loading the whole library
+  if sonarrMirror.persistent:
+    sonarrMirror.sync()
+    radarrMirror.sync()
+
   r = requests.get(f"{tautulliHost}/api/v2/?apikey={tautulliAPIkey}&cmd=get_library_media_info&section_id={tautulliShowSectionID}&length={tautulliNumRows}&refresh=true&order_column=added_at&order_dir=asc")
   shows = json.loads(r.text)
 
@@ -3,6 +3,7 @@ import argparse
 import time
 from shared.arr import Sonarr, Radarr
 from shared.discord import discordUpdate
+from shared.symlinks import checkSymlinks
 from shared.shared import repair, intersperse
 
 def parse_interval(interval_str):
@@ -26,6 +27,8 @@ parser.add_argument('--dry-run', action='store_true', help='Perform a dry run wi
 parser.add_argument('--no-confirm', action='store_true', help='Execute without confirmation prompts.')
 parser.add_argument('--repair-interval', type=str, default=repair['repairInterval'], help='Optional interval in smart format (e.g. 1h2m3s) to wait between repairing each media file.')
 parser.add_argument('--run-interval', type=str, default=repair['runInterval'], help='Optional interval in smart format (e.g. 1w2d3h4m5s) to run the repair process.')
+parser.add_argument('--scan-workers', type=int, default=repair['scanWorkers'], help='Number of files to check at once on the mount.')
+parser.add_argument('--scan-timeout', type=float, default=repair['scanTimeout'], help='Seconds to wait for a single file on the mount before reporting it as timed out.')
 args = parser.parse_args()
 
 if not args.repair_interval and not args.run_interval:
@@ -45,38 +48,78 @@ except Exception as e:
     print(f"Invalid interval format for run interval: {args.run_interval}")
     exit(1)
 
+def getMonitoredMedia(arr):
+    mirror = arr.getMirror()
+    if mirror.persistent:
+        mirror.sync()
+        return [media for media in mirror.getAll() if media.anyMonitoredChildren]
+
+    # An unsaved mirror would hold the whole library in memory for one run, so the compact records are streamed instead
+    return [media for media in arr.getAll() if media.anyMonitoredChildren]
+
+def getFileInventory(arr, media):
+    """Returns the files of the given media as {mediaId: {childId: [files]}}."""
+    mirror = arr.getMirror()
+    if mirror.persistent:
+        return mirror.getFileInventory()
+
+    inventory = {item.id: {} for item in media}
+    for _, files in arr.iterFiles(list(inventory)):
+        for file in files:
+            inventory.setdefault(file.mediaId, {}).setdefault(file.parentId, []).append(file)
+
+    return inventory
+
 def main():
     print("Collecting media...")
     sonarr = Sonarr()
     radarr = Radarr()
-    sonarrMedia = [(sonarr, media) for media in sonarr.getAll() if media.anyMonitoredChildren]
-    radarrMedia = [(radarr, media) for media in radarr.getAll() if media.anyMonitoredChildren]
+    sonarrMedia = [(sonarr, media) for media in getMonitoredMedia(sonarr)]
+    radarrMedia = [(radarr, media) for media in getMonitoredMedia(radarr)]
     print("Finished collecting media.")
+
+    print("Collecting files...")
+    inventories = {
+        sonarr: getFileInventory(sonarr, [media for _, media in sonarrMedia]),
+        radarr: getFileInventory(radarr, [media for _, media in radarrMedia])
+    }
+    print("Finished collecting files.")
+
+    print("Checking files...")
+    start = time.monotonic()
+    paths = [childFile.path for arr, media in intersperse(sonarrMedia, radarrMedia) for childId in media.monitoredChildrenIds for childFile in inventories[arr][media.id].get(childId, [])]
+    healths = checkSymlinks(paths, args.scan_workers, args.scan_timeout)
+    print(f"Finished checking {len(healths)} files in {time.monotonic() - start:.1f}s.")
     
     for arr, media in intersperse(sonarrMedia, radarrMedia):
-        files = {}
-        for file in arr.getFiles(media):
-            if file.parentId in files:
-                files[file.parentId].append(file)
-            else:
-                files[file.parentId] = [file]
+        files = inventories[arr][media.id]
         for childId in media.monitoredChildrenIds:
             realPaths = []
             brokenSymlinks = []
+            timedOut = []
 
             childFiles = files.get(childId, [])
             for childFile in childFiles:
+                health = healths[childFile.path]
+
+                if health.timedOut:
+                    timedOut.append(childFile.path)
+                    continue
 
-                fullPath = childFile.path
-                realPath = os.path.realpath(fullPath)
-                realPaths.append(realPath)
-                
+                realPaths.append(health.realPath)
 
-                if os.path.islink(fullPath) and not os.path.exists(realPath):
-                    brokenSymlinks.append(realPath)
-            
+                if health.broken:
+                    brokenSymlinks.append(health.realPath)
+
+            # Files that can't be checked might be fine, so nothing is deleted until they can
+            if timedOut:
+                print("Title:", media.title)
+                print("Movie ID/Season Number:", childId)
+                print("Timed out checking:")
+                [print(path) for path in timedOut]
+                print()
             # If not full season just repair individual episodes?
-            if brokenSymlinks:
+            elif brokenSymlinks:
                 print("Title:", media.title)
                 print("Movie ID/Season Number:", childId)
                 print("Broken symlinks:")
@@ -97,6 +140,8 @@ def main():
                         print("Searching for new files")
                         results = arr.automaticSearch(media, childId)
                         print(results)
+                        if arr.getMirror().persistent:
+                            arr.getMirror().refresh([media.id])
                         
                         if repair_interval_seconds > 0:
                             time.sleep(repair_interval_seconds)
@@ -112,6 +157,11 @@ def main():
                     [print(parentFolder) for parentFolder in parentFolders]
                     print()
 
+    for arr in (sonarr, radarr):
+        print(f"{type(arr).__name__} requests:")
+        [print(line) for line in arr.stats.summary()]
+        print()
+
 if run_interval_seconds > 0:
     while True:
         main()
@@ -1,7 +1,18 @@
+import asyncio
+import codecs
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from json import JSONDecoder, JSONDecodeError, dumps, loads
 from abc import ABC, abstractmethod
-from typing import Type, List
+from typing import Type, List, Callable
 import requests
-from shared.shared import sonarr, radarr, checkRequiredEnvs
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from shared.shared import sonarr, radarr, arr, checkRequiredEnvs
 
 def validateSonarrHost():
     url = f"{sonarr['host']}"
@@ -49,31 +60,83 @@ requiredEnvs = {
 
 checkRequiredEnvs(requiredEnvs)
 
+# From Radarr Radarr/src/NzbDrone.Core/Organizer/FileNameBuilder.cs
+def cleanFileName(name):
+    result = name
+    badCharacters = ["\\", "/", "<", ">", "?", "*", ":", "|", "\""]
+    goodCharacters = ["+", "+", "", "", "!", "-", "", "", ""]
+
+    for i, char in enumerate(badCharacters):
+        result = result.replace(char, goodCharacters[i])
+    
+    return result.strip()
+
+def iterJsonArray(chunks, decoder: JSONDecoder=JSONDecoder()):
+    """Yields the items of a JSON array as its chunks arrive, so the whole document is never held at once."""
+    decode = codecs.getincrementaldecoder('utf-8')().decode
+    buffer = ''
+    index = 0
+    started = False
+
+    for chunk in chunks:
+        buffer = buffer[index:] + decode(chunk)
+        index = 0
+
+        while True:
+            while index < len(buffer) and buffer[index] in ' \t\r\n,':
+                index += 1
+            if index == len(buffer):
+                break
+
+            if not started:
+                if buffer[index] != '[':
+                    raise ValueError(f"Expected a JSON array, got {buffer[index:index + 100]!r}")
+                started = True
+                index += 1
+                continue
+
+            if buffer[index] == ']':
+                return
+
+            try:
+                item, index = decoder.raw_decode(buffer, index)
+            except JSONDecodeError:
+                # The item continues in the next chunk
+                break
+
+            yield item
+
+    raise ValueError('JSON array ended early')
+
 class Media(ABC):
-    def __init__(self, json) -> None:
-        super().__init__()
-        self.json = json
+    """Keeps only the fields the scripts read. Without the full JSON, put fetches it again and writes only the fields changed here."""
 
-    @property 
-    @abstractmethod
-    def size(self):
-        pass
+    # changes holds the new path and {childId: monitored} set since the record was read
+    __slots__ = ('json', 'id', 'title', '_path', 'size', 'changes')
 
-    @property
-    def id(self):
-        return self.json['id']
+    def __init__(self, json, compact: bool=False) -> None:
+        super().__init__()
+        self.json = None if compact else json
+        self.id = json['id']
+        self.title = json['title']
+        self._path = json['path']
+        self.changes = None
+
+    def _recordChange(self, key, value):
+        if self.changes is None:
+            self.changes = {}
+        self.changes[key] = value
 
-    @property
-    def title(self):
-        return self.json['title']
-    
     @property
     def path(self):
-        return self.json['path']
+        return self._path
     
     @path.setter
     def path(self, path):
-        self.json['path'] = path
+        self._path = path
+        self._recordChange('path', path)
+        if self.json is not None:
+            self.json['path'] = path
 
     @property
     def anyMonitoredChildren(self):
@@ -97,37 +160,77 @@ class Media(ABC):
     def setChildMonitored(self, childId: int, monitored: bool):
         pass
 
+    def applyTo(self, json):
+        """Writes the changes made to this record onto a fresh full JSON of this media, leaving everything else as the arr has it."""
+        for key, value in (self.changes or {}).items():
+            if key == 'path':
+                json['path'] = value
+            else:
+                self.setJsonChildMonitored(json, key, value)
+
+        return json
+
 class Movie(Media):
+    __slots__ = ('monitored', 'hasFile')
+
+    def __init__(self, json, compact: bool=False) -> None:
+        super().__init__(json, compact)
+        self.size = json['sizeOnDisk']
+        self.monitored = json['monitored']
+        self.hasFile = json['hasFile']
+
     @property
-    def size(self):
-        return self.json['sizeOnDisk']
+    def childIds(self):
+        return [self.id]
 
     @property
     def monitoredChildrenIds(self):
-        return [self.id] if self.json['monitored'] else []
+        return [self.id] if self.monitored else []
 
     @property
     def fullyAvailableChildrenIds(self):
-        return [self.id] if self.json['hasFile'] else []
+        return [self.id] if self.hasFile else []
     
     def setChildMonitored(self, childId: int, monitored: bool):
-        self.json["monitored"] = monitored
+        self.monitored = monitored
+        self._recordChange(childId, monitored)
+        if self.json is not None:
+            self.setJsonChildMonitored(self.json, childId, monitored)
+
+    @staticmethod
+    def setJsonChildMonitored(json, childId: int, monitored: bool):
+        json["monitored"] = monitored
 
 class Show(Media):
+    # (seasonNumber, monitored, fullyAvailable) for each season
+    __slots__ = ('seasons',)
+
+    def __init__(self, json, compact: bool=False) -> None:
+        super().__init__(json, compact)
+        self.size = json['statistics']['sizeOnDisk']
+        self.seasons = [(season['seasonNumber'], season['monitored'], season['statistics']['percentOfEpisodes'] == 100) for season in json['seasons']]
+
     @property
-    def size(self):
-        return self.json['statistics']['sizeOnDisk']
+    def childIds(self):
+        return [seasonNumber for seasonNumber, _, _ in self.seasons]
 
     @property
     def monitoredChildrenIds(self):
-        return [season['seasonNumber'] for season in self.json['seasons'] if season['monitored']]
+        return [seasonNumber for seasonNumber, monitored, _ in self.seasons if monitored]
 
     @property
     def fullyAvailableChildrenIds(self):
-        return [season['seasonNumber'] for season in self.json['seasons'] if season['statistics']['percentOfEpisodes'] == 100]
+        return [seasonNumber for seasonNumber, _, fullyAvailable in self.seasons if fullyAvailable]
 
     def setChildMonitored(self, childId: int, monitored: bool):
-        for season in self.json['seasons']:
+        self.seasons = [(seasonNumber, monitored if seasonNumber == childId else seasonMonitored, fullyAvailable) for seasonNumber, seasonMonitored, fullyAvailable in self.seasons]
+        self._recordChange(childId, monitored)
+        if self.json is not None:
+            self.setJsonChildMonitored(self.json, childId, monitored)
+
+    @staticmethod
+    def setJsonChildMonitored(json, childId: int, monitored: bool):
+        for season in json['seasons']:
             if season['seasonNumber'] == childId:
                 season['monitored'] = monitored
                 break
@@ -158,16 +261,400 @@ class MediaFile(ABC):
     def parentId(self):
         pass
 
+    @property
+    @abstractmethod
+    def mediaId(self):
+        pass
+
 class EpisodeFile(MediaFile):
     @property
     def parentId(self):
         return self.json['seasonNumber']
 
+    @property
+    def mediaId(self):
+        return self.json['seriesId']
+
 class MovieFile(MediaFile):
     @property
     def parentId(self):
         return self.json['movieId']
+
+    @property
+    def mediaId(self):
+        return self.json['movieId']
     
+class RefreshCoordinator():
+    class Waiter():
+        def __init__(self, isImported: Callable[[], bool], count: int, future: asyncio.Future) -> None:
+            self.isImported = isImported
+            self.remaining = count
+            self.future = future
+
+    def __init__(self, arr: 'Arr', interval: float=1) -> None:
+        self.arr = arr
+        self.interval = interval
+        self.waiters = []
+        self.requested = 0
+        self.sent = 0
+        self._task = None
+
+    @property
+    def saved(self):
+        return self.requested - self.sent
+
+    async def refresh(self, isImported: Callable[[], bool], count=60):
+        loop = asyncio.get_running_loop()
+        waiter = self.Waiter(isImported, count, loop.create_future())
+        self.waiters.append(waiter)
+        # What refreshing on its own would have cost
+        self.requested += count
+
+        if not self._task or self._task.done():
+            self._task = loop.create_task(self._run())
+
+        await waiter.future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            for waiter in list(self.waiters):
+                if waiter.remaining <= 0 or waiter.isImported():
+                    self.waiters.remove(waiter)
+                    waiter.future.set_result(None)
+
+            if not self.waiters:
+                break
+
+            # One command at a time covers every waiting download
+            try:
+                await loop.run_in_executor(None, self.arr.refreshMonitoredDownloads)
+                self.sent += 1
+            except Exception as e:
+                print('Error refreshing monitored downloads:', e)
+
+            for waiter in self.waiters:
+                waiter.remaining -= 1
+
+            await asyncio.sleep(self.interval)
+
+class HistoryIndex():
+    def __init__(self, arr: 'Arr', size: int, maxAge: float=1) -> None:
+        self.arr = arr
+        self.size = size
+        self.maxAge = maxAge
+        self.records = OrderedDict()
+        self.byHash = {}
+        self.byTitle = {}
+        self.lastDate = None
+        self.refreshedAt = None
+        self._lock = threading.Lock()
+
+    def _keys(self, item):
+        torrentHash = item['data'].get('torrentInfoHash', '').casefold()
+        title = cleanFileName(item['sourceTitle'].casefold())
+        return torrentHash, title
+
+    def _add(self, item):
+        torrentHash, title = self._keys(item)
+        self.records[item['id']] = item
+        if torrentHash:
+            self.byHash.setdefault(torrentHash, set()).add(item['id'])
+        self.byTitle.setdefault(title, set()).add(item['id'])
+
+    def _remove(self, id: int):
+        item = self.records.pop(id)
+        torrentHash, title = self._keys(item)
+        self.byHash.get(torrentHash, set()).discard(id)
+        self.byTitle.get(title, set()).discard(id)
+
+    def refresh(self):
+        with self._lock:
+            # Concurrent failures share whichever refresh just finished
+            if self.refreshedAt and time.monotonic() - self.refreshedAt < self.maxAge:
+                return
+
+            if self.lastDate:
+                records = self.arr.getHistorySince(self.lastDate)
+            else:
+                records = self.arr.getHistory(self.size)['records']
+
+            for item in sorted(records, key=lambda item: item['id']):
+                if item['id'] not in self.records:
+                    self._add(item)
+                self.lastDate = max(self.lastDate or item['date'], item['date'])
+
+            while len(self.records) > self.size:
+                self._remove(next(iter(self.records)))
+
+            self.refreshedAt = time.monotonic()
+
+    def find(self, torrentHash: str, title: str):
+        self.refresh()
+
+        with self._lock:
+            ids = self.byHash.get(torrentHash.casefold(), set()) | self.byTitle.get(title.casefold(), set())
+            return [self.records[id] for id in sorted(ids)]
+
+class ArrMirror():
+    """A local SQLite copy of an Arr library, shared by every script. After the first full load only the media named in the history since the last sync are fetched again."""
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS media (
+            arr TEXT NOT NULL,
+            id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            path TEXT,
+            tvdbId INTEGER,
+            tmdbId INTEGER,
+            json TEXT NOT NULL,
+            PRIMARY KEY (arr, id)
+        );
+        CREATE INDEX IF NOT EXISTS mediaTvdbId ON media (arr, tvdbId);
+        CREATE INDEX IF NOT EXISTS mediaTmdbId ON media (arr, tmdbId);
+        CREATE TABLE IF NOT EXISTS files (
+            arr TEXT NOT NULL,
+            id INTEGER NOT NULL,
+            mediaId INTEGER NOT NULL,
+            path TEXT,
+            json TEXT NOT NULL,
+            PRIMARY KEY (arr, id)
+        );
+        CREATE INDEX IF NOT EXISTS filesMediaId ON files (arr, mediaId);
+        CREATE INDEX IF NOT EXISTS filesPath ON files (arr, path);
+        CREATE TABLE IF NOT EXISTS tags (
+            arr TEXT NOT NULL,
+            mediaId INTEGER NOT NULL,
+            tagId INTEGER NOT NULL,
+            PRIMARY KEY (arr, mediaId, tagId)
+        );
+        CREATE TABLE IF NOT EXISTS syncs (
+            arr TEXT PRIMARY KEY,
+            fullSync REAL NOT NULL,
+            historyDate TEXT
+        );
+    '''
+
+    def __init__(self, arr: 'Arr', path: str=None, fullSyncInterval: float=86400) -> None:
+        self.arr = arr
+        # Sonarr and Radarr, and their 4k instances, share one database
+        self.key = f"{arr.endpoint}@{arr.host}"
+        # Without a path the mirror only lives as long as the process
+        self.path = path or ':memory:'
+        self.fullSyncInterval = fullSyncInterval
+        self._lock = threading.Lock()
+        self._syncLock = threading.Lock()
+        self._connection = None
+
+    @property
+    def persistent(self):
+        return self.path != ':memory:'
+
+    @property
+    def connection(self):
+        if not self._connection:
+            connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(self.schema)
+            self._connection = connection
+
+        return self._connection
+
+    def _write(self, statements):
+        with self._lock:
+            connection = self.connection
+            connection.execute('BEGIN')
+            try:
+                for sql, params in statements:
+                    connection.execute(sql, params)
+                connection.execute('COMMIT')
+            except:
+                connection.execute('ROLLBACK')
+                raise
+
+    def _read(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self.connection.execute(sql, params)]
+
+    def _iterate(self, sql, params=(), batchSize: int=500):
+        # Rows are fetched a batch at a time, so the library is never all in memory
+        with self._lock:
+            cursor = self.connection.execute(sql, params)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(batchSize)
+            if not rows:
+                break
+            yield from rows
+
+    def _mediaStatements(self, json):
+        statements = [
+            ('INSERT OR REPLACE INTO media (arr, id, title, path, tvdbId, tmdbId, json) VALUES (?, ?, ?, ?, ?, ?, ?)', (self.key, json['id'], json['title'], json.get('path'), json.get('tvdbId'), json.get('tmdbId'), dumps(json))),
+            ('DELETE FROM tags WHERE arr = ? AND mediaId = ?', (self.key, json['id']))
+        ]
+        statements += [('INSERT OR IGNORE INTO tags (arr, mediaId, tagId) VALUES (?, ?, ?)', (self.key, json['id'], tagId)) for tagId in json.get('tags', [])]
+        return statements
+
+    def _filesStatements(self, mediaIds, files):
+        statements = [(f"DELETE FROM files WHERE arr = ? AND mediaId IN ({', '.join('?' * len(mediaIds))})", (self.key, *mediaIds))]
+        statements += [('INSERT OR REPLACE INTO files (arr, id, mediaId, path, json) VALUES (?, ?, ?, ?, ?)', (self.key, file.id, file.mediaId, file.path, dumps(file.json))) for file in files]
+        return statements
+
+    def _removeStatements(self, mediaIds):
+        placeholders = ', '.join('?' * len(mediaIds))
+        return [(f"DELETE FROM {table} WHERE arr = ? AND {column} IN ({placeholders})", (self.key, *mediaIds)) for table, column in (('media', 'id'), ('files', 'mediaId'), ('tags', 'mediaId'))]
+
+    def _latestHistoryDate(self):
+        records = self.arr.getHistory(1)['records']
+        return records[0]['date'] if records else None
+
+    def sync(self):
+        """Loads the whole library the first time and every fullSyncInterval, otherwise only the media with history since the last sync."""
+        with self._syncLock:
+            syncs = self._read('SELECT * FROM syncs WHERE arr = ?', (self.key,))
+            if not syncs or not syncs[0]['historyDate'] or time.time() - syncs[0]['fullSync'] > self.fullSyncInterval:
+                self.fullSync()
+            else:
+                self.incrementalSync(syncs[0]['historyDate'])
+
+    def fullSync(self):
+        # Taken first, so changes made during the load are picked up by the next sync
+        historyDate = self._latestHistoryDate()
+        start = time.time()
+        mediaIds = []
+
+        for json in self.arr._iterAllJson():
+            self._write(self._mediaStatements(json))
+            mediaIds.append(json['id'])
+
+        currentIds = set(mediaIds)
+        removedIds = [row['id'] for row in self._read('SELECT id FROM media WHERE arr = ?', (self.key,)) if row['id'] not in currentIds]
+        if removedIds:
+            self._write(self._removeStatements(removedIds))
+
+        for batchIds, files in self.arr.iterFiles(mediaIds):
+            self._write(self._filesStatements(batchIds, files))
+
+        self._write([('INSERT OR REPLACE INTO syncs (arr, fullSync, historyDate) VALUES (?, ?, ?)', (self.key, start, historyDate))])
+
+    def incrementalSync(self, historyDate: str):
+        idName = f"{self.arr.endpoint}Id"
+        # The last sync already saw the records at historyDate
+        records = [record for record in self.arr.getHistorySince(historyDate) if record['date'] != historyDate]
+        self.refresh({record[idName] for record in records if record.get(idName)})
+
+        latestDate = max((record['date'] for record in records), default=historyDate)
+        self._write([('UPDATE syncs SET historyDate = ? WHERE arr = ?', (latestDate, self.key))])
+
+    def refresh(self, mediaIds):
+        """Fetches the given media and their files again, dropping those no longer in the library. Scripts call it after changing media."""
+        existingIds = []
+        removedIds = []
+        for mediaId in mediaIds:
+            try:
+                self._write(self._mediaStatements(self.arr._getJson(mediaId)))
+                existingIds.append(mediaId)
+            except requests.HTTPError as e:
+                if e.response.status_code != 404:
+                    raise
+                removedIds.append(mediaId)
+
+        if removedIds:
+            self._write(self._removeStatements(removedIds))
+
+        for batchIds, files in self.arr.iterFiles(existingIds):
+            self._write(self._filesStatements(batchIds, files))
+
+    def _media(self, row):
+        return self.arr.constructor(loads(row['json']), compact=True) if row else None
+
+    def getAll(self):
+        for row in self._iterate('SELECT json FROM media WHERE arr = ? ORDER BY id', (self.key,)):
+            yield self._media(row)
+
+    def get(self, mediaId: int):
+        rows = self._read('SELECT json FROM media WHERE arr = ? AND id = ?', (self.key, mediaId))
+        return self._media(rows[0] if rows else None)
+
+    def _findBy(self, column: str, value: int, term: str):
+        rows = self._read(f"SELECT json FROM media WHERE arr = ? AND {column} = ?", (self.key, int(value)))
+        if rows:
+            return self._media(rows[0])
+
+        # Added since the last sync
+        results = [result for result in self.arr.lookup(f"{term}:{value}") if result.get('id')]
+        if not results:
+            return None
+
+        self.refresh([results[0]['id']])
+        return self.get(results[0]['id'])
+
+    def findByTvdbId(self, tvdbId: int):
+        return self._findBy('tvdbId', tvdbId, 'tvdb')
+
+    def findByTmdbId(self, tmdbId: int):
+        return self._findBy('tmdbId', tmdbId, 'tmdb')
+
+    def getTags(self, mediaId: int):
+        return [row['tagId'] for row in self._read('SELECT tagId FROM tags WHERE arr = ? AND mediaId = ?', (self.key, mediaId))]
+
+    def getFile(self, fileId: int):
+        rows = self._read('SELECT json FROM files WHERE arr = ? AND id = ?', (self.key, fileId))
+        return self.arr.fileConstructor(loads(rows[0]['json'])) if rows else None
+
+    def findFileByPath(self, path: str):
+        rows = self._read('SELECT json FROM files WHERE arr = ? AND path = ?', (self.key, path))
+        return self.arr.fileConstructor(loads(rows[0]['json'])) if rows else None
+
+    def getFiles(self, mediaId: int):
+        """Returns the media's files as {childId: [files]}."""
+        files = {}
+        for row in self._read('SELECT json FROM files WHERE arr = ? AND mediaId = ?', (self.key, mediaId)):
+            file = self.arr.fileConstructor(loads(row['json']))
+            files.setdefault(file.parentId, []).append(file)
+
+        return files
+
+    def getFileInventory(self):
+        """Returns the files of the whole library as {mediaId: {childId: [files]}}."""
+        inventory = {row['id']: {} for row in self._read('SELECT id FROM media WHERE arr = ?', (self.key,))}
+        for row in self._iterate('SELECT json FROM files WHERE arr = ?', (self.key,)):
+            file = self.arr.fileConstructor(loads(row['json']))
+            inventory.setdefault(file.mediaId, {}).setdefault(file.parentId, []).append(file)
+
+        return inventory
+
+class RequestStats():
+    """Counts requests and their latency per endpoint."""
+
+    def __init__(self) -> None:
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float, ok: bool):
+        with self._lock:
+            stats = self.endpoints.setdefault(endpoint, {'count': 0, 'errors': 0, 'seconds': 0, 'maxSeconds': 0})
+            stats['count'] += 1
+            stats['errors'] += not ok
+            stats['seconds'] += seconds
+            stats['maxSeconds'] = max(stats['maxSeconds'], seconds)
+
+    def summary(self):
+        with self._lock:
+            return [f"{endpoint}: {stats['count']} requests, {stats['errors']} errors, {stats['seconds']:.1f}s total, {stats['seconds'] / stats['count'] * 1000:.0f}ms average, {stats['maxSeconds'] * 1000:.0f}ms max" for endpoint, stats in sorted(self.endpoints.items(), key=lambda item: -item[1]['seconds'])]
+
+def createSession(connectionLimit: int=arr['connectionLimit'], maxRetries: int=arr['maxRetries'], retryBackoff: float=arr['retryBackoff']):
+    # Retry's default methods are the idempotent ones, so commands are never sent twice
+    retry = Retry(total=maxRetries, backoff_factor=retryBackoff, status_forcelist=(429, 500, 502, 503, 504), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=connectionLimit, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
 class Arr(ABC):
     def __init__(self, host: str, apiKey: str, endpoint: str, fileEndpoint: str, childIdName: str, childName: str, constructor: Type[Media], fileConstructor: Type[MediaFile]) -> None:
         self.host = host
@@ -178,46 +665,115 @@ class Arr(ABC):
         self.childName = childName
         self.constructor = constructor
         self.fileConstructor = fileConstructor
+        self.refreshCoordinator = RefreshCoordinator(self)
+        self.historyIndex = None
+        self.mirror = None
+        self.session = createSession()
+        self.timeout = arr['timeout']
+        self.stats = RequestStats()
+
+    def _request(self, method: str, endpoint: str, url: str, **kwargs):
+        """Sends a request on the instance's keep-alive session, recording its latency under endpoint."""
+        start = time.monotonic()
+        ok = False
+        try:
+            kwargs.setdefault('timeout', self.timeout)
+            response = self.session.request(method, url, **kwargs)
+            ok = response.ok
+            return response
+        finally:
+            self.stats.record(f"{method} {endpoint}", time.monotonic() - start, ok)
+
+    def _getJson(self, id: int):
+        get = self._request('GET', f"{self.endpoint}/{{id}}", f"{self.host}/api/v3/{self.endpoint}/{id}?apiKey={self.apiKey}")
+        get.raise_for_status()
+        return get.json()
 
     def get(self, id: int):
-        get = requests.get(f"{self.host}/api/v3/{self.endpoint}/{id}?apiKey={self.apiKey}")
-        return self.constructor(get.json())
+        return self.constructor(self._getJson(id))
+
+    def _iterAllJson(self, chunkSize: int=64 * 1024):
+        get = self._request('GET', self.endpoint, f"{self.host}/api/v3/{self.endpoint}?apiKey={self.apiKey}", stream=True)
+        with closing(get):
+            yield from iterJsonArray(get.iter_content(chunkSize))
 
     def getAll(self):
-        get = requests.get(f"{self.host}/api/v3/{self.endpoint}?apiKey={self.apiKey}")
-        return map(self.constructor, get.json())
+        """Streams the library into compact records without their full JSON."""
+        for json in self._iterAllJson():
+            yield self.constructor(json, compact=True)
+
+    def lookup(self, term: str):
+        lookup = self._request('GET', f"{self.endpoint}/lookup", f"{self.host}/api/v3/{self.endpoint}/lookup", params={'apiKey': self.apiKey, 'term': term})
+        return lookup.json()
 
     def put(self, media: Media):
-        put = requests.put(f"{self.host}/api/v3/{self.endpoint}/{media.id}?apiKey={self.apiKey}&moveFiles=true", json=media.json)
+        json = media.json if media.json is not None else media.applyTo(self._getJson(media.id))
+        put = self._request('PUT', f"{self.endpoint}/{{id}}", f"{self.host}/api/v3/{self.endpoint}/{media.id}?apiKey={self.apiKey}&moveFiles=true", json=json)
 
     def getFiles(self, media: Media):
-        files = requests.get(f"{self.host}/api/v3/{self.fileEndpoint}?apiKey={self.apiKey}&{self.endpoint}Id={media.id}")   
+        files = self._request('GET', self.fileEndpoint, f"{self.host}/api/v3/{self.fileEndpoint}?apiKey={self.apiKey}&{self.endpoint}Id={media.id}")   
         return map(self.fileConstructor, files.json())
 
+    def _getFilesBatch(self, mediaIds: List[int]):
+        files = self._request('GET', self.fileEndpoint, f"{self.host}/api/v3/{self.fileEndpoint}", params={'apiKey': self.apiKey, f"{self.endpoint}Id": mediaIds})
+        return list(map(self.fileConstructor, files.json()))
+
+    def iterFiles(self, mediaIds: List[int], workers: int=arr['inventoryWorkers']):
+        """Yields each batch of media ids with the files of those media."""
+        # As many media per request as the endpoint accepts, with a few requests in flight at once
+        batches = [mediaIds[i:i + self.fileBatchSize] for i in range(0, len(mediaIds), self.fileBatchSize)]
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            yield from zip(batches, executor.map(self._getFilesBatch, batches))
+
+    def getEpisodes(self, seriesId: int):
+        episodes = self._request('GET', 'episode', f"{self.host}/api/v3/episode", params={'apiKey': self.apiKey, 'seriesId': seriesId})
+        return episodes.json()
+
     def deleteFiles(self, files: List[MediaFile]):
         fileIds = [file.id for file in files]
-        delete = requests.delete(f"{self.host}/api/v3/{self.fileEndpoint}/bulk?apiKey={self.apiKey}", json={f"{self.fileEndpoint}ids": fileIds})
+        delete = self._request('DELETE', f"{self.fileEndpoint}/bulk", f"{self.host}/api/v3/{self.fileEndpoint}/bulk?apiKey={self.apiKey}", json={f"{self.fileEndpoint}ids": fileIds})
 
         return delete.json()
 
     def getHistory(self, pageSize: int):
-        historyRequest = requests.get(f"{self.host}/api/v3/history?pageSize={pageSize}&apiKey={self.apiKey}")
+        historyRequest = self._request('GET', 'history', f"{self.host}/api/v3/history?pageSize={pageSize}&apiKey={self.apiKey}")
         history = historyRequest.json()
 
         return history
 
+    def getHistorySince(self, date: str):
+        historyRequest = self._request('GET', 'history/since', f"{self.host}/api/v3/history/since?date={date}&apiKey={self.apiKey}")
+        history = historyRequest.json()
+
+        return history
+
+    def getHistoryIndex(self, size: int):
+        if not self.historyIndex:
+            self.historyIndex = HistoryIndex(self, size)
+
+        return self.historyIndex
+
+    def getMirror(self):
+        if not self.mirror:
+            self.mirror = ArrMirror(self, arr['mirrorPath'], arr['mirrorFullSyncInterval'])
+
+        return self.mirror
+
     def failHistoryItem(self, historyId: int):
-        failRequest = requests.post(f"{self.host}/api/v3/history/failed/{historyId}?apiKey={self.apiKey}")
+        failRequest = self._request('POST', 'history/failed/{id}', f"{self.host}/api/v3/history/failed/{historyId}?apiKey={self.apiKey}")
 
     def refreshMonitoredDownloads(self):
-        commandRequest = requests.post(f"{self.host}/api/v3/command?apiKey={self.apiKey}", json={'name': 'RefreshMonitoredDownloads'}, headers={'Content-Type': 'application/json'})
+        commandRequest = self._request('POST', 'command', f"{self.host}/api/v3/command?apiKey={self.apiKey}", json={'name': 'RefreshMonitoredDownloads'}, headers={'Content-Type': 'application/json'})
 
     def interactiveSearch(self, media: Media, childId: int):
-        search = requests.get(f"{self.host}/api/v3/release?apiKey={self.apiKey}&{self.endpoint}Id={media.id}{f'&{self.childIdName}={childId}' if childId != media.id else ''}")
+        search = self._request('GET', 'release', f"{self.host}/api/v3/release?apiKey={self.apiKey}&{self.endpoint}Id={media.id}{f'&{self.childIdName}={childId}' if childId != media.id else ''}")
         return search.json()
 
     def automaticSearch(self, media: Media, childId: int):
-        search = requests.post(
+        search = self._request(
+            'POST', 
+            'command', 
             f"{self.host}/api/v3/command?apiKey={self.apiKey}", 
             json=self._automaticSearchJson(media, childId), 
         )
@@ -232,9 +788,11 @@ class Sonarr(Arr):
     fileEndpoint = 'episodefile'
     childIdName = 'seasonNumber'
     childName = 'Season'
+    # The episode file endpoint only takes a single series
+    fileBatchSize = 1
 
-    def __init__(self) -> None:
-        super().__init__(Sonarr.host, Sonarr.apiKey, Sonarr.endpoint, Sonarr.fileEndpoint, Sonarr.childIdName, Sonarr.childName, Show, EpisodeFile)
+    def __init__(self, host: str=None, apiKey: str=None) -> None:
+        super().__init__(host or Sonarr.host, apiKey or Sonarr.apiKey, Sonarr.endpoint, Sonarr.fileEndpoint, Sonarr.childIdName, Sonarr.childName, Show, EpisodeFile)
 
     def _automaticSearchJson(self, media: Media, childId: int):
         return {"name": f"{self.childName}Search", f"{self.endpoint}Id": media.id, self.childIdName: childId}
@@ -246,9 +804,10 @@ class Radarr(Arr):
     fileEndpoint = 'moviefile'
     childIdName = None
     childName = 'Movies'
+    fileBatchSize = 100
 
-    def __init__(self) -> None:
-        super().__init__(Radarr.host, Radarr.apiKey, Radarr.endpoint, Radarr.fileEndpoint, None, Radarr.childName, Movie, MovieFile)
+    def __init__(self, host: str=None, apiKey: str=None) -> None:
+        super().__init__(host or Radarr.host, apiKey or Radarr.apiKey, Radarr.endpoint, Radarr.fileEndpoint, None, Radarr.childName, Movie, MovieFile)
 
     def _automaticSearchJson(self, media: Media, childId: int):
         return {"name": f"{self.childName}Search", f"{self.endpoint}Ids": [media.id]}
@@ -1,4 +1,11 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
 import requests
+from collections import OrderedDict
 from discord_webhook import DiscordWebhook, DiscordEmbed
 from shared.shared import discord, checkRequiredEnvs
 
@@ -18,24 +25,138 @@ requiredEnvs = {
 if discord['enabled'] or discord['updateEnabled']:
     checkRequiredEnvs(requiredEnvs)
 
+class DiscordNotifier():
+    """Sends notifications from a background thread so callers never wait on Discord."""
+
+    maxEmbeds = 10
+    # Discord's limits for one message and one embed description
+    maxMessageLength = 6000
+    maxDescriptionLength = 4000
+
+    def __init__(self, queueSize: int=discord['queueSize'], batchSeconds: float=discord['batchSeconds'], spillPath: str=discord['spillPath']) -> None:
+        self.queue = queue.Queue(maxsize=queueSize)
+        self.batchSeconds = batchSeconds
+        self.spillPath = spillPath
+        self.dropped = 0
+        self._thread = None
+        self._startLock = threading.Lock()
+        self._sendLock = threading.Lock()
+        self._spillLock = threading.Lock()
+
+    def notify(self, username, title, description, color):
+        self._start()
+        # Callers pass any message, but it is counted by value and spilled as JSON
+        notification = (username, str(title), None if description is None else str(description), color)
+        try:
+            self.queue.put_nowait(notification)
+        except queue.Full:
+            self._spill(notification)
+
+    def _start(self):
+        with self._startLock:
+            if not self._thread:
+                self._thread = threading.Thread(target=self._run, name='discord', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _spill(self, notification):
+        if not self.spillPath:
+            self.dropped += 1
+            return
+
+        try:
+            with self._spillLock, open(self.spillPath, 'a') as spillFile:
+                spillFile.write(json.dumps(notification) + '\n')
+        except OSError:
+            self.dropped += 1
+
+    def _unspill(self):
+        if not self.spillPath:
+            return []
+
+        with self._spillLock:
+            try:
+                with open(self.spillPath) as spillFile:
+                    lines = spillFile.readlines()
+                os.remove(self.spillPath)
+            except OSError:
+                return []
+
+        return [tuple(json.loads(line)) for line in lines if line.strip()]
+
+    def _drain(self):
+        notifications = []
+        while True:
+            try:
+                notifications.append(self.queue.get_nowait())
+            except queue.Empty:
+                return notifications
+
+    def _run(self):
+        while True:
+            notifications = [self.queue.get()]
+            # Anything arriving shortly after goes out in the same messages
+            time.sleep(self.batchSeconds)
+            try:
+                self._send(notifications + self._drain() + self._unspill())
+            except Exception as e:
+                # One bad batch must not stop every later notification
+                print('Error sending Discord notifications:', e)
+
+    def flush(self):
+        self._send(self._drain() + self._unspill())
+
+    def _send(self, notifications):
+        with self._sendLock:
+            if self.dropped:
+                notifications.append(('Error Bot', 'Discord notifications dropped', f"```{self.dropped} notifications were dropped because the queue was full```", 15548997))
+                self.dropped = 0
+
+            # Identical notifications are sent once with a count
+            counts = OrderedDict()
+            for notification in notifications:
+                counts[notification] = counts.get(notification, 0) + 1
+
+            byUsername = OrderedDict()
+            for (username, title, description, color), count in counts.items():
+                if count > 1:
+                    title = f"{title} (x{count})"
+                description = description if description is None or len(description) <= self.maxDescriptionLength else f"{description[:self.maxDescriptionLength]}..."
+                byUsername.setdefault(username, []).append(DiscordEmbed(title, description, color=color))
+
+            for username, embeds in byUsername.items():
+                batch = []
+                batchLength = 0
+                for embed in embeds:
+                    length = len(embed.title or '') + len(embed.description or '')
+                    if batch and (len(batch) == self.maxEmbeds or batchLength + length > self.maxMessageLength):
+                        self._execute(username, batch)
+                        batch = []
+                        batchLength = 0
+                    batch.append(embed)
+                    batchLength += length
+
+                if batch:
+                    self._execute(username, batch)
+
+    def _execute(self, username, embeds):
+        try:
+            webhook = DiscordWebhook(
+                url=discord['webhookUrl'], 
+                rate_limit_retry=True, 
+                username=username, 
+                embeds=embeds
+            )
+            webhook.execute()
+        except Exception as e:
+            print('Error sending Discord notification:', e)
+
+notifier = DiscordNotifier()
+
 def discordError(title, message=None):
     if discord['enabled']:
-        embed = DiscordEmbed(title, f"```{message}```", color=15548997)
-        webhook = DiscordWebhook(
-            url=discord['webhookUrl'], 
-            rate_limit_retry=True, 
-            username='Error Bot', 
-            embeds=[embed]
-        )
-        response = webhook.execute()
+        notifier.notify('Error Bot', title, f"```{message}```", 15548997)
 
 def discordUpdate(title, message=None):
     if discord['updateEnabled']:
-        embed = DiscordEmbed(title, message, color=3066993)
-        webhook = DiscordWebhook(
-            url=discord['webhookUrl'], 
-            rate_limit_retry=True, 
-            username='Update Bot', 
-            embeds=[embed]
-        )
-        response = webhook.execute()
+        notifier.notify('Update Bot', title, message, 3066993)
@@ -0,0 +1,154 @@
+import errno
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from shared.shared import blackhole
+from shared.symlinks import walkFiles
+
+# Errors meaning the copy method isn't supported between these files, so the next one is tried
+_unsupportedErrors = (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL)
+_bufferSize = 8 * 1024 ** 2
+
+def _copyFileRange(sourceFd, destinationFd, offset, count):
+    return os.copy_file_range(sourceFd, destinationFd, count, offset, offset)
+
+def _sendfile(sourceFd, destinationFd, offset, count):
+    # sendfile writes at the destination's own position
+    os.lseek(destinationFd, offset, os.SEEK_SET)
+    return os.sendfile(destinationFd, sourceFd, offset, count)
+
+def _readWrite(sourceFd, destinationFd, offset, count):
+    data = os.pread(sourceFd, min(count, _bufferSize), offset)
+    return os.pwrite(destinationFd, data, offset) if data else 0
+
+_copyMethods = ([_copyFileRange] if hasattr(os, 'copy_file_range') else []) + [_sendfile, _readWrite]
+
+class CopyStats():
+    def __init__(self) -> None:
+        self.files = 0
+        self.bytes = 0
+        self.copiedBytes = 0
+        self.resumedBytes = 0
+        self.seconds = 0
+
+    def summary(self):
+        throughput = self.copiedBytes / 1024 ** 2 / self.seconds if self.seconds else 0
+        return f"Copied {self.files} files, {self.copiedBytes / 1024 ** 3:.2f}GB in {self.seconds:.1f}s ({throughput:.0f}MB/s), {self.resumedBytes / 1024 ** 3:.2f}GB already copied"
+
+class _FileProgress():
+    """Tracks the copied chunks of one file in a sidecar, so an interrupted copy only redoes the missing ones."""
+
+    def __init__(self, destinationPath, size, chunkSize) -> None:
+        self.path = f"{destinationPath}.progress"
+        self.size = size
+        self.chunkSize = chunkSize
+        self.done = set()
+        self._lock = threading.Lock()
+
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    progress = json.load(f)
+                if progress['size'] == size and progress['chunkSize'] == chunkSize:
+                    self.done = set(progress['done'])
+            except (ValueError, KeyError):
+                pass
+
+    def complete(self, offset):
+        with self._lock:
+            self.done.add(offset)
+            if len(self.done) == len(range(0, self.size, self.chunkSize)):
+                os.remove(self.path)
+                return
+
+            with open(self.path, 'w') as f:
+                json.dump({'size': self.size, 'chunkSize': self.chunkSize, 'done': sorted(self.done)}, f)
+
+def _copyChunk(sourcePath, destinationPath, offset, count):
+    sourceFd = os.open(sourcePath, os.O_RDONLY)
+    try:
+        destinationFd = os.open(destinationPath, os.O_WRONLY)
+        try:
+            methods = iter(_copyMethods)
+            method = next(methods)
+            end = offset + count
+            while offset < end:
+                try:
+                    copied = method(sourceFd, destinationFd, offset, end - offset)
+                except OSError as e:
+                    if e.errno not in _unsupportedErrors or method is _readWrite:
+                        raise
+                    method = next(methods)
+                    continue
+
+                if not copied:
+                    raise OSError(errno.EIO, f"Unexpected end of file at {offset}", sourcePath)
+                offset += copied
+        finally:
+            os.close(destinationFd)
+    finally:
+        os.close(sourceFd)
+
+def copyTree(source, destination, workers: int=blackhole['copyWorkers'], chunkSize: int=blackhole['copyChunkSize'], retries: int=2):
+    """Copies every file under source to destination, several files at once and large files in ranges. Running it again after a failure resumes from the chunks already copied."""
+    start = time.monotonic()
+    stats = CopyStats()
+    chunks = []
+
+    for relRoot, filename, sourcePath in walkFiles(source):
+        destinationPath = os.path.join(destination, relRoot, filename)
+        size = os.stat(sourcePath).st_size
+        stats.files += 1
+        stats.bytes += size
+
+        progress = _FileProgress(destinationPath, size, chunkSize)
+        if os.path.exists(destinationPath) and not os.path.exists(progress.path) and os.path.getsize(destinationPath) == size:
+            stats.resumedBytes += size
+            continue
+
+        os.makedirs(os.path.dirname(destinationPath), exist_ok=True)
+        if size and not os.path.exists(progress.path):
+            # Marks the file as incomplete until its last chunk is done
+            with open(progress.path, 'w') as f:
+                json.dump({'size': size, 'chunkSize': chunkSize, 'done': []}, f)
+
+        with open(destinationPath, 'ab') as f:
+            f.truncate(size)
+
+        for offset in range(0, size, chunkSize):
+            count = min(chunkSize, size - offset)
+            if offset in progress.done:
+                stats.resumedBytes += count
+            else:
+                chunks.append((sourcePath, destinationPath, offset, count, progress))
+
+    def copy(chunk):
+        sourcePath, destinationPath, offset, count, progress = chunk
+        for attempt in range(retries + 1):
+            try:
+                _copyChunk(sourcePath, destinationPath, offset, count)
+                break
+            except OSError:
+                if attempt == retries:
+                    raise
+
+        progress.complete(offset)
+        return count
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(copy, chunk) for chunk in chunks]
+
+    errors = []
+    for future in futures:
+        try:
+            stats.copiedBytes += future.result()
+        except OSError as e:
+            errors.append(e)
+
+    stats.seconds = time.monotonic() - start
+    if errors:
+        raise errors[0]
+
+    return stats
@@ -0,0 +1,141 @@
+import sqlite3
+import threading
+import time
+
+class Journal():
+    """Records the state of every blackhole job so jobs left in processing/ can be resumed after a restart."""
+
+    terminalStatuses = ('completed', 'failed')
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY,
+            filePath TEXT NOT NULL,
+            isRadarr INTEGER NOT NULL,
+            is4k INTEGER NOT NULL,
+            hash TEXT,
+            account TEXT,
+            rdId TEXT,
+            status TEXT NOT NULL,
+            mountFolder TEXT,
+            error TEXT,
+            created REAL NOT NULL,
+            updated REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobsFilePath ON jobs (filePath, status);
+        CREATE TABLE IF NOT EXISTS events (
+            jobId INTEGER NOT NULL REFERENCES jobs (id),
+            status TEXT NOT NULL,
+            time REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS symlinks (
+            jobId INTEGER NOT NULL REFERENCES jobs (id),
+            link TEXT NOT NULL,
+            target TEXT NOT NULL,
+            PRIMARY KEY (jobId, link)
+        );
+        CREATE TABLE IF NOT EXISTS warmUps (
+            jobId INTEGER NOT NULL REFERENCES jobs (id),
+            path TEXT NOT NULL,
+            seconds REAL NOT NULL,
+            ok INTEGER NOT NULL,
+            error TEXT
+        );
+    '''
+
+    def __init__(self, path: str=None) -> None:
+        # Without a path the journal only lives as long as the process
+        self.path = path or ':memory:'
+        self._lock = threading.Lock()
+        self._connection = None
+
+    @property
+    def connection(self):
+        if not self._connection:
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(self.schema)
+
+            # Journals created before jobs were bound to an account
+            columns = {row['name'] for row in connection.execute('PRAGMA table_info(jobs)')}
+            if 'account' not in columns:
+                connection.execute('ALTER TABLE jobs ADD COLUMN account TEXT')
+            self._connection = connection
+
+        return self._connection
+
+    def _write(self, statements):
+        with self._lock:
+            connection = self.connection
+            connection.execute('BEGIN')
+            try:
+                cursors = [connection.execute(sql, params) for sql, params in statements]
+                connection.execute('COMMIT')
+            except:
+                connection.execute('ROLLBACK')
+                raise
+
+            return cursors
+
+    def _read(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self.connection.execute(sql, params)]
+
+    def startJob(self, filePath: str, isRadarr: bool, is4k: bool=False):
+        """Returns the unfinished job for filePath, or a new one."""
+        jobs = self._read(f"SELECT * FROM jobs WHERE filePath = ? AND status NOT IN ({', '.join('?' * len(self.terminalStatuses))}) ORDER BY id DESC LIMIT 1", (filePath, *self.terminalStatuses))
+        if jobs:
+            return jobs[0]
+
+        now = time.time()
+        cursors = self._write([
+            ('INSERT INTO jobs (filePath, isRadarr, is4k, status, created, updated) VALUES (?, ?, ?, ?, ?, ?)', (filePath, int(isRadarr), int(is4k), 'queued', now, now)),
+            ('INSERT INTO events (jobId, status, time) VALUES (last_insert_rowid(), ?, ?)', ('queued', now))
+        ])
+
+        return self.getJob(cursors[0].lastrowid)
+
+    def getJob(self, id: int):
+        jobs = self._read('SELECT * FROM jobs WHERE id = ?', (id,))
+        return jobs[0] if jobs else None
+
+    def update(self, job: dict, **fields):
+        """Updates the job's columns, a status change is also recorded as an event."""
+        fields = {key: value for key, value in fields.items() if job.get(key) != value}
+        if not fields:
+            return
+
+        now = time.time()
+        statements = [(f"UPDATE jobs SET {', '.join(f'{key} = ?' for key in fields)}, updated = ? WHERE id = ?", (*fields.values(), now, job['id']))]
+        if 'status' in fields:
+            statements.append(('INSERT INTO events (jobId, status, time) VALUES (?, ?, ?)', (job['id'], fields['status'], now)))
+
+        self._write(statements)
+        job.update(fields, updated=now)
+
+    def addSymlinks(self, job: dict, links):
+        self._write([('INSERT OR IGNORE INTO symlinks (jobId, link, target) VALUES (?, ?, ?)', (job['id'], link, target)) for link, target in links])
+
+    def addWarmUps(self, job: dict, results):
+        self._write([('INSERT INTO warmUps (jobId, path, seconds, ok, error) VALUES (?, ?, ?, ?, ?)', (job['id'], result['path'], result['seconds'], int(result['ok']), result['error'])) for result in results])
+
+    def getInFlight(self, isRadarr: bool=None, is4k: bool=None):
+        sql = f"SELECT * FROM jobs WHERE status NOT IN ({', '.join('?' * len(self.terminalStatuses))})"
+        params = list(self.terminalStatuses)
+        if isRadarr is not None:
+            sql += ' AND isRadarr = ?'
+            params.append(int(isRadarr))
+        if is4k is not None:
+            sql += ' AND is4k = ?'
+            params.append(int(is4k))
+
+        return self._read(sql, params)
+
+    def getSummary(self, since: float=0):
+        """Job counts by status and the average seconds from queued to completed, for jobs created after since."""
+        counts = {row['status']: row['count'] for row in self._read('SELECT status, COUNT(*) AS count FROM jobs WHERE created >= ? GROUP BY status', (since,))}
+        durations = self._read("SELECT AVG(events.time - jobs.created) AS seconds FROM jobs JOIN events ON events.jobId = jobs.id AND events.status = 'completed' WHERE jobs.created >= ?", (since,))
+
+        return {'counts': counts, 'averageSeconds': durations[0]['seconds']}
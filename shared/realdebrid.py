@@ -0,0 +1,550 @@
+import asyncio
+import contextvars
+import fcntl
+import hashlib
+import json
+import threading
+import time
+import aiohttp
+from collections import deque
+from contextlib import contextmanager
+from shared.shared import realdebrid
+
+# Priority of the job making a request, lower is more urgent
+requestPriority = contextvars.ContextVar('requestPriority', default=0)
+
+class RateLimiter():
+    def __init__(self, requestsPerMinute: int=realdebrid['requestsPerMinute'], statePath: str=realdebrid['rateLimitPath'], key: str='default') -> None:
+        self.maxRate = requestsPerMinute / 60
+        self.minRate = self.maxRate / 10
+        # After slowing down, the full rate is regained over about a minute
+        self.recovery = self.maxRate / 60
+        self.capacity = max(1, requestsPerMinute / 12)
+        self.statePath = statePath
+        self.key = key
+        self._state = None
+        self._recent = deque()
+        self._lock = threading.Lock()
+        self._failures = {}
+        self._waiting = {}
+
+    def _initialState(self):
+        return {'tokens': self.capacity, 'rate': self.maxRate, 'updated': time.time(), 'pausedUntil': {}}
+
+    @contextmanager
+    def _lockedState(self):
+        with self._lock:
+            if not self.statePath:
+                if self._state is None:
+                    self._state = self._initialState()
+                yield self._state
+                return
+
+            # The state file is shared by every blackhole container pointed at it, with a budget per account
+            with open(self.statePath, 'a+') as stateFile:
+                fcntl.flock(stateFile, fcntl.LOCK_EX)
+                try:
+                    stateFile.seek(0)
+                    try:
+                        states = json.loads(stateFile.read() or 'null') or {}
+                    except ValueError:
+                        states = {}
+
+                    if not isinstance(states.get(self.key), dict):
+                        states[self.key] = self._initialState()
+                    yield states[self.key]
+
+                    stateFile.seek(0)
+                    stateFile.truncate()
+                    stateFile.write(json.dumps(states))
+                finally:
+                    fcntl.flock(stateFile, fcntl.LOCK_UN)
+
+    def _take(self, endpoint: str):
+        now = time.time()
+        with self._lockedState() as state:
+            pausedUntil = max(state['pausedUntil'].get('*', 0), state['pausedUntil'].get(endpoint, 0))
+            if pausedUntil > now:
+                return pausedUntil - now
+
+            elapsed = max(0, now - state['updated'])
+            rate = min(self.maxRate, state['rate'] + elapsed * self.recovery)
+            tokens = min(self.capacity, state['tokens'] + elapsed * rate)
+            state['rate'] = rate
+            state['updated'] = now
+
+            if tokens >= 1:
+                state['tokens'] = tokens - 1
+                return 0
+
+            state['tokens'] = tokens
+            return (1 - tokens) / rate
+
+    async def _call(self, function, *args):
+        # Only the shared state file blocks, the in-memory state is updated on the loop
+        if not self.statePath:
+            return function(*args)
+
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    async def acquire(self, endpoint: str):
+        priority = requestPriority.get()
+        self._waiting[priority] = self._waiting.get(priority, 0) + 1
+        try:
+            while True:
+                # Tokens go to more urgent jobs first while any of them are waiting
+                if any(count for waitingPriority, count in self._waiting.items() if waitingPriority < priority):
+                    await asyncio.sleep(1 / self.maxRate)
+                    continue
+
+                wait = await self._call(self._take, endpoint)
+                if wait <= 0:
+                    now = time.monotonic()
+                    self._recent.append(now)
+                    self._trimRecent(now)
+                    return
+                await asyncio.sleep(wait)
+        finally:
+            self._waiting[priority] -= 1
+
+    def _trimRecent(self, now: float):
+        # Trimmed on every request, recentRate is only read when there is more than one account
+        cutoff = now - 60
+        while self._recent and self._recent[0] < cutoff:
+            self._recent.popleft()
+
+    def recentRate(self):
+        # Requests per second made by this process over the last minute
+        self._trimRecent(time.monotonic())
+        return len(self._recent) / 60
+
+    def _pause(self, endpoint: str, status: int, delay: float):
+        with self._lockedState() as state:
+            # 429 means the whole account is over its limit, 503 only this endpoint
+            key = '*' if status == 429 else endpoint
+            state['pausedUntil'][key] = max(state['pausedUntil'].get(key, 0), time.time() + delay)
+            if status == 429:
+                state['rate'] = max(self.minRate, state['rate'] / 2)
+
+    async def backoff(self, endpoint: str, status: int, retryAfter: float=None):
+        failures = self._failures.get(endpoint, 0) + 1
+        self._failures[endpoint] = failures
+        delay = retryAfter if retryAfter is not None else min(60, 2 ** failures)
+
+        await self._call(self._pause, endpoint, status, delay)
+
+    def success(self, endpoint: str):
+        self._failures.pop(endpoint, None)
+
+class RealDebrid():
+    retryStatuses = (429, 503)
+
+    def __init__(self, host: str, apiKey: str, timeout: int=realdebrid['timeout'], connectionLimit: int=realdebrid['connectionLimit'], maxRetries: int=realdebrid['maxRetries'], rateLimiter: RateLimiter=None) -> None:
+        self.host = host
+        self.apiKey = apiKey
+        self.timeout = timeout
+        self.connectionLimit = connectionLimit
+        self.maxRetries = maxRetries
+        self.rateLimiter = rateLimiter or RateLimiter()
+        self._session = None
+        self._loop = None
+
+    def _getSession(self):
+        # aiohttp sessions are bound to the loop they were created in
+        loop = asyncio.get_running_loop()
+        if not self._session or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.connectionLimit, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._loop = loop
+
+        return self._session
+
+    def _retryAfter(self, response: aiohttp.ClientResponse):
+        try:
+            return float(response.headers['Retry-After'])
+        except (KeyError, ValueError):
+            return None
+
+    async def _request(self, method: str, path: str, params: dict=None, timeout: int=None, **kwargs):
+        session = self._getSession()
+        params = {**(params or {}), 'auth_token': self.apiKey}
+        if timeout:
+            kwargs['timeout'] = aiohttp.ClientTimeout(total=timeout)
+        endpoint = '/'.join(path.split('/')[:2])
+
+        for attempt in range(self.maxRetries + 1):
+            await self.rateLimiter.acquire(endpoint)
+
+            async with session.request(method, f"{self.host}{path}", params=params, **kwargs) as response:
+                if response.status in self.retryStatuses:
+                    if attempt == self.maxRetries:
+                        raise Exception(f"RealDebrid {endpoint} still returned {response.status} after {self.maxRetries} retries")
+
+                    print(f"RealDebrid {endpoint} returned {response.status}, backing off")
+                    await self.rateLimiter.backoff(endpoint, response.status, self._retryAfter(response))
+                    continue
+
+                self.rateLimiter.success(endpoint)
+
+                body = await response.read()
+                if not body:
+                    return None
+
+                return await response.json(content_type=None)
+
+    async def getInstantAvailability(self, torrentHash: str):
+        return await self._request('GET', f"torrents/instantAvailability/{torrentHash}")
+
+    async def getAvailableHosts(self):
+        return await self._request('GET', 'torrents/availableHosts')
+
+    async def addTorrent(self, host: str, data: bytes):
+        return await self._request('PUT', 'torrents/addTorrent', params={'host': host}, data=data)
+
+    async def addMagnet(self, host: str, magnet: str):
+        return await self._request('POST', 'torrents/addMagnet', params={'host': host}, data={'magnet': magnet})
+
+    async def getActiveCount(self):
+        return await self._request('GET', 'torrents/activeCount')
+
+    async def getTorrents(self, page: int=1, limit: int=100):
+        return await self._request('GET', 'torrents', params={'page': page, 'limit': limit}) or []
+
+    async def getInfo(self, id: str):
+        return await self._request('GET', f"torrents/info/{id}")
+
+    async def selectFiles(self, id: str, files: str):
+        return await self._request('POST', f"torrents/selectFiles/{id}", data={'files': files})
+
+    async def delete(self, id: str):
+        return await self._request('DELETE', f"torrents/delete/{id}")
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+class InstantAvailability():
+    chunkSize = 50
+
+    def __init__(self, realDebrid: RealDebrid, ttl: float=realdebrid['instantAvailabilityTtl'], batchDelay: float=0.05) -> None:
+        self.realDebrid = realDebrid
+        self.ttl = ttl
+        self.batchDelay = batchDelay
+        self.cache = {}
+        self._pending = {}
+        self._flushHandle = None
+
+    def _getCached(self, torrentHash: str):
+        cached = self.cache.get(torrentHash)
+        if cached and cached[0] > time.monotonic():
+            return True, cached[1]
+
+        return False, None
+
+    def _request(self, torrentHash: str):
+        future = self._pending.get(torrentHash)
+        if not future:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            # Prefetched lookups may never be awaited, so retrieve any exception to keep the loop quiet
+            future.add_done_callback(lambda future: future.cancelled() or future.exception())
+            self._pending[torrentHash] = future
+
+            if not self._flushHandle:
+                self._flushHandle = loop.call_later(self.batchDelay, lambda: loop.create_task(self._flush()))
+
+        return future
+
+    def prefetch(self, torrentHashes):
+        for torrentHash in torrentHashes:
+            torrentHash = torrentHash.casefold()
+            if not self._getCached(torrentHash)[0]:
+                self._request(torrentHash)
+
+    async def get(self, torrentHash: str, refresh=False):
+        torrentHash = torrentHash.casefold()
+        if not refresh:
+            found, hosters = self._getCached(torrentHash)
+            if found:
+                return hosters
+
+        return await self._request(torrentHash)
+
+    async def _flush(self):
+        # A batch serves every job, not just the one that started it
+        requestPriority.set(0)
+        self._flushHandle = None
+        pending, self._pending = self._pending, {}
+        torrentHashes = list(pending)
+
+        chunks = [torrentHashes[i:i + self.chunkSize] for i in range(0, len(torrentHashes), self.chunkSize)]
+        await asyncio.gather(*(self._fetchChunk(chunk, pending) for chunk in chunks))
+
+    async def _fetchChunk(self, chunk, pending):
+        try:
+            instantAvailabilities = await self.realDebrid.getInstantAvailability('/'.join(chunk)) or {}
+            instantAvailabilities = {torrentHash.casefold(): hosters for torrentHash, hosters in instantAvailabilities.items()}
+        except Exception as e:
+            for torrentHash in chunk:
+                pending[torrentHash].set_exception(e)
+            return
+
+        expires = time.monotonic() + self.ttl
+        for torrentHash in chunk:
+            # Unavailable hashes come back as an empty list instead of a dict of hosters
+            hosters = instantAvailabilities.get(torrentHash)
+            availability = next(iter(hosters.values()), None) if hosters else None
+
+            self.cache[torrentHash] = (expires, availability)
+            pending[torrentHash].set_result(availability)
+
+class TorrentPoller():
+    pageSize = 100
+
+    def __init__(self, realDebrid: RealDebrid, minInterval: float=realdebrid['pollInterval'], maxInterval: float=realdebrid['maxPollInterval']) -> None:
+        self.realDebrid = realDebrid
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.subscribers = {}
+        self._task = None
+
+    def subscribe(self, id: str):
+        queue = asyncio.Queue(maxsize=1)
+        self.subscribers.setdefault(id, []).append(queue)
+
+        if not self._task or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+        return queue
+
+    def unsubscribe(self, id: str, queue: asyncio.Queue):
+        queues = self.subscribers.get(id, [])
+        if queue in queues:
+            queues.remove(queue)
+        if not queues:
+            self.subscribers.pop(id, None)
+
+    def _publish(self, id: str, info):
+        for queue in self.subscribers.get(id, []):
+            # Only the latest status matters, drop anything not yet consumed
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(info)
+
+    async def _poll(self):
+        remaining = set(self.subscribers)
+        requestCount = 0
+        page = 1
+
+        # Torrents are listed newest first so watched ones are almost always on the first page
+        while remaining:
+            torrents = await self.realDebrid.getTorrents(page, self.pageSize)
+            requestCount += 1
+
+            for torrent in torrents:
+                if torrent['id'] in remaining:
+                    remaining.discard(torrent['id'])
+                    self._publish(torrent['id'], torrent)
+
+            if len(torrents) < self.pageSize:
+                break
+            page += 1
+
+        for id in remaining:
+            self._publish(id, await self.realDebrid.getInfo(id))
+            requestCount += 1
+
+        return requestCount
+
+    async def _run(self):
+        requestPriority.set(0)
+        while self.subscribers:
+            requestCount = 1
+            try:
+                requestCount = await self._poll()
+            except Exception as e:
+                print('Error polling torrents:', e)
+
+            # Keep the poller's request rate constant no matter how many torrents are active
+            await asyncio.sleep(min(self.maxInterval, self.minInterval * requestCount))
+
+class AvailableHosts():
+    """Caches the host to add torrents with, a stale value is used while it is refreshed in the background."""
+
+    def __init__(self, realDebrid: RealDebrid, ttl: float=realdebrid['availableHostsTtl']) -> None:
+        self.realDebrid = realDebrid
+        self.ttl = ttl
+        self.hosts = None
+        self._updated = None
+        self._refresh = None
+
+    async def _fetch(self):
+        try:
+            hosts = await self.realDebrid.getAvailableHosts()
+            # An error body would otherwise be served for the whole ttl
+            if not isinstance(hosts, list) or not hosts:
+                raise Exception(f"Error getting available hosts: {hosts}")
+
+            self.hosts = hosts
+            self._updated = time.monotonic()
+        except Exception as e:
+            # Callers with a cached host keep using it, the others see the error
+            if self.hosts:
+                print('Error refreshing available hosts:', e)
+            else:
+                raise
+
+    def _startRefresh(self):
+        if not self._refresh or self._refresh.done():
+            self._refresh = asyncio.get_running_loop().create_task(self._fetch())
+            self._refresh.add_done_callback(lambda refresh: refresh.cancelled() or refresh.exception())
+
+        return self._refresh
+
+    async def get(self):
+        if not self.hosts:
+            await asyncio.shield(self._startRefresh())
+        elif time.monotonic() - self._updated > self.ttl:
+            self._startRefresh()
+
+        return self.hosts[0]['host']
+
+    def invalidate(self):
+        self.hosts = None
+
+class RealDebridAccount():
+    activeCountTtl = 30
+
+    def __init__(self, apiKey: str, mountTorrentsPath: str, host: str=realdebrid['host']) -> None:
+        # Stable across restarts and containers, unlike the account's position in the list
+        # A missing key has already been reported by checkRequiredEnvs, its requests fail like any unauthorized one
+        self.id = hashlib.sha1((apiKey or '').encode()).hexdigest()[:8]
+        self.mountTorrentsPath = mountTorrentsPath
+        self.realDebrid = RealDebrid(host, apiKey, rateLimiter=RateLimiter(key=self.id))
+        self.torrentPoller = TorrentPoller(self.realDebrid)
+        self.availableHosts = AvailableHosts(self.realDebrid)
+        self.activeCount = 0
+        self.activeLimit = None
+        self._activeCountUpdated = None
+        self._activeCountRefresh = None
+
+    async def _refreshActiveCount(self):
+        try:
+            activeCount = await self.realDebrid.getActiveCount()
+            self.activeCount = activeCount['nb']
+            self.activeLimit = activeCount['limit']
+        except Exception as e:
+            print(f"Error getting active torrent count for account {self.id}:", e)
+        self._activeCountUpdated = time.monotonic()
+
+    async def getLoad(self):
+        """Share of the account's active torrent limit in use plus share of its request budget used in the last minute."""
+        if not self._activeCountUpdated or time.monotonic() - self._activeCountUpdated > self.activeCountTtl:
+            # Submissions arriving together share one lookup
+            if not self._activeCountRefresh or self._activeCountRefresh.done():
+                self._activeCountRefresh = asyncio.get_running_loop().create_task(self._refreshActiveCount())
+            await asyncio.shield(self._activeCountRefresh)
+
+        rateLimiter = self.realDebrid.rateLimiter
+        return (self.activeCount / self.activeLimit if self.activeLimit else 0) + rateLimiter.recentRate() / rateLimiter.maxRate
+
+    def added(self):
+        # Counted locally until the next refresh of the active count
+        self.activeCount += 1
+
+class RealDebridPool():
+    def __init__(self, accounts) -> None:
+        self.accounts = accounts
+        self.primary = accounts[0]
+
+    def getAccount(self, id: str):
+        return next((account for account in self.accounts if account.id == id), None)
+
+    async def choose(self):
+        if len(self.accounts) == 1:
+            return self.primary
+
+        loads = await asyncio.gather(*(account.getLoad() for account in self.accounts))
+        return min(zip(self.accounts, loads), key=lambda accountLoad: accountLoad[1])[0]
+
+class TorrentRegistry():
+    pageSize = 1000
+
+    def __init__(self, pool: RealDebridPool, indexTtl: float=realdebrid['torrentIndexTtl']) -> None:
+        self.pool = pool
+        self.indexTtl = indexTtl
+        self.entries = {}
+        self.indexes = {}
+        self._indexUpdated = {}
+        self._indexLock = None
+
+    def acquire(self, torrentHash: str):
+        """Returns a future resolving to the account and RealDebrid id of the torrent, and whether the caller is the one expected to submit it."""
+        torrentHash = torrentHash.casefold()
+        entry = self.entries.get(torrentHash)
+        if entry:
+            entry['holders'] += 1
+            return entry['torrent'], False
+
+        entry = {'torrent': asyncio.get_running_loop().create_future(), 'holders': 1}
+        self.entries[torrentHash] = entry
+        return entry['torrent'], True
+
+    def resolve(self, torrentHash: str, account: RealDebridAccount=None, id: str=None):
+        entry = self.entries.get(torrentHash.casefold())
+        if entry and not entry['torrent'].done():
+            entry['torrent'].set_result((account, id) if id else None)
+
+    def release(self, torrentHash: str):
+        torrentHash = torrentHash.casefold()
+        entry = self.entries.get(torrentHash)
+        if not entry:
+            return
+
+        entry['holders'] -= 1
+        if entry['holders'] <= 0:
+            del self.entries[torrentHash]
+            if not entry['torrent'].done():
+                entry['torrent'].set_result(None)
+
+    def holders(self, torrentHash: str):
+        entry = self.entries.get(torrentHash.casefold())
+        return entry['holders'] if entry else 0
+
+    async def findDownloaded(self, torrentHash: str):
+        """Returns the account and listing of a downloaded torrent with this hash in any account."""
+        torrentHash = torrentHash.casefold()
+        for account in self.pool.accounts:
+            await self._refreshIndex(account)
+
+            torrent = self.indexes[account.id].get(torrentHash)
+            if torrent and torrent['status'] == 'downloaded':
+                return account, torrent
+
+        return None
+
+    async def _refreshIndex(self, account: RealDebridAccount):
+        if not self._indexLock:
+            self._indexLock = asyncio.Lock()
+
+        async with self._indexLock:
+            indexUpdated = self._indexUpdated.get(account.id)
+            if indexUpdated and time.monotonic() - indexUpdated < self.indexTtl:
+                return
+
+            index = {}
+            page = 1
+            while True:
+                torrents = await account.realDebrid.getTorrents(page, self.pageSize)
+                for torrent in torrents:
+                    # Listed newest first, keep the newest copy of a hash
+                    index.setdefault(torrent['hash'].casefold(), torrent)
+
+                if len(torrents) < self.pageSize:
+                    break
+                page += 1
+
+            self.indexes[account.id] = index
+            self._indexUpdated[account.id] = time.monotonic()
@@ -24,10 +24,31 @@ blackhole = {
     'baseWatchPath': env.string('BLACKHOLE_BASE_WATCH_PATH', default=None),
     'radarrPath': env.string('BLACKHOLE_RADARR_PATH', default=None),
     'sonarrPath': env.string('BLACKHOLE_SONARR_PATH', default=None),
+    'radarrPath4k': env.string('BLACKHOLE_RADARR_PATH_4K', default=None),
+    'sonarrPath4k': env.string('BLACKHOLE_SONARR_PATH_4K', default=None),
+    'additionalRdMountTorrentsPaths': env.list('BLACKHOLE_ADDITIONAL_RD_MOUNT_TORRENTS_PATHS', default=[]),
     'failIfNotCached': env.bool('BLACKHOLE_FAIL_IF_NOT_CACHED', default=None),
     'rdMountRefreshSeconds': env.int('BLACKHOLE_RD_MOUNT_REFRESH_SECONDS', default=None),
     'waitForTorrentTimeout': env.int('BLACKHOLE_WAIT_FOR_TORRENT_TIMEOUT', default=None),
     'historyPageSize': env.int('BLACKHOLE_HISTORY_PAGE_SIZE', default=None),
+    'workers': env.int('BLACKHOLE_WORKERS', default=20),
+    'debounceSeconds': env.float('BLACKHOLE_DEBOUNCE_SECONDS', default=0.5),
+    'mountPollInterval': env.float('BLACKHOLE_MOUNT_POLL_INTERVAL', default=1),
+    'journalPath': env.string('BLACKHOLE_JOURNAL_PATH', default=None),
+    'symlinkWorkers': env.int('BLACKHOLE_SYMLINK_WORKERS', default=8),
+    'symlinkJobs': env.int('BLACKHOLE_SYMLINK_JOBS', default=2),
+    'warmUpEnabled': env.bool('BLACKHOLE_WARM_UP_ENABLED', default=False),
+    'warmUpWorkers': env.int('BLACKHOLE_WARM_UP_WORKERS', default=4),
+    'warmUpHeadBytes': env.int('BLACKHOLE_WARM_UP_HEAD_BYTES', default=4194304),
+    'warmUpTailBytes': env.int('BLACKHOLE_WARM_UP_TAIL_BYTES', default=1048576),
+    'warmUpTimeout': env.float('BLACKHOLE_WARM_UP_TIMEOUT', default=60),
+    'warmUpPolicy': env.string('BLACKHOLE_WARM_UP_POLICY', default='announce'),
+    'radarrCopy': env.bool('BLACKHOLE_RADARR_COPY', default=False),
+    'sonarrCopy': env.bool('BLACKHOLE_SONARR_COPY', default=False),
+    'copyWorkers': env.int('BLACKHOLE_COPY_WORKERS', default=4),
+    'copyChunkSize': env.int('BLACKHOLE_COPY_CHUNK_SIZE', default=268435456),
+    'copyJobs': env.int('BLACKHOLE_COPY_JOBS', default=2),
+    'copyWaitTimeout': env.int('BLACKHOLE_COPY_WAIT_TIMEOUT', default=600),
 }
 
 server = {
@@ -51,12 +72,26 @@ overseerr = {
 
 sonarr = {
     'host': env.string('SONARR_HOST', default=None),
-    'apiKey': env.string('SONARR_API_KEY', default=None)
+    'apiKey': env.string('SONARR_API_KEY', default=None),
+    'host4k': env.string('SONARR_HOST_4K', default=None),
+    'apiKey4k': env.string('SONARR_API_KEY_4K', default=None)
 }
 
 radarr = {
     'host': env.string('RADARR_HOST', default=None),
-    'apiKey': env.string('RADARR_API_KEY', default=None)
+    'apiKey': env.string('RADARR_API_KEY', default=None),
+    'host4k': env.string('RADARR_HOST_4K', default=None),
+    'apiKey4k': env.string('RADARR_API_KEY_4K', default=None)
+}
+
+arr = {
+    'timeout': env.float('ARR_TIMEOUT', default=60),
+    'connectionLimit': env.int('ARR_CONNECTION_LIMIT', default=10),
+    'maxRetries': env.int('ARR_MAX_RETRIES', default=3),
+    'retryBackoff': env.float('ARR_RETRY_BACKOFF', default=0.5),
+    'inventoryWorkers': env.int('ARR_INVENTORY_WORKERS', default=4),
+    'mirrorPath': env.string('ARR_MIRROR_PATH', default=None),
+    'mirrorFullSyncInterval': env.int('ARR_MIRROR_FULL_SYNC_INTERVAL', default=86400)
 }
 
 tautulli = {
@@ -66,7 +101,18 @@ tautulli = {
 
 realdebrid = {
     'host': env.string('REALDEBRID_HOST', default=None),
-    'apiKey': env.string('REALDEBRID_API_KEY', default=None)
+    'apiKey': env.string('REALDEBRID_API_KEY', default=None),
+    'additionalApiKeys': env.list('REALDEBRID_ADDITIONAL_API_KEYS', default=[]),
+    'timeout': env.int('REALDEBRID_TIMEOUT', default=30),
+    'connectionLimit': env.int('REALDEBRID_CONNECTION_LIMIT', default=20),
+    'pollInterval': env.float('REALDEBRID_POLL_INTERVAL', default=1),
+    'maxPollInterval': env.float('REALDEBRID_MAX_POLL_INTERVAL', default=10),
+    'instantAvailabilityTtl': env.int('REALDEBRID_INSTANT_AVAILABILITY_TTL', default=120),
+    'torrentIndexTtl': env.int('REALDEBRID_TORRENT_INDEX_TTL', default=60),
+    'availableHostsTtl': env.int('REALDEBRID_AVAILABLE_HOSTS_TTL', default=3600),
+    'requestsPerMinute': env.int('REALDEBRID_REQUESTS_PER_MINUTE', default=200),
+    'maxRetries': env.int('REALDEBRID_MAX_RETRIES', default=5),
+    'rateLimitPath': env.string('REALDEBRID_RATE_LIMIT_PATH', default=None)
 }
 
 trakt = {
@@ -76,12 +122,17 @@ trakt = {
 discord = {
     'enabled': env.bool('DISCORD_ENABLED', default=None),
     'updateEnabled': env.bool('DISCORD_UPDATE_ENABLED', default=None),
-    'webhookUrl': env.string('DISCORD_WEBHOOK_URL', default=None)
+    'webhookUrl': env.string('DISCORD_WEBHOOK_URL', default=None),
+    'queueSize': env.int('DISCORD_QUEUE_SIZE', default=1000),
+    'batchSeconds': env.float('DISCORD_BATCH_SECONDS', default=2),
+    'spillPath': env.string('DISCORD_SPILL_PATH', default=None)
 }
 
 repair = {
     'repairInterval': env.string('REPAIR_REPAIR_INTERVAL', default=None),
-    'runInterval': env.string('REPAIR_RUN_INTERVAL', default=None)
+    'runInterval': env.string('REPAIR_RUN_INTERVAL', default=None),
+    'scanWorkers': env.int('REPAIR_SCAN_WORKERS', default=16),
+    'scanTimeout': env.float('REPAIR_SCAN_TIMEOUT', default=30)
 }
 
 plexHeaders = {
@@ -0,0 +1,177 @@
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from shared.shared import blackhole, repair
+
+multiSeasonRegex1 = r'(?<=[\W_][Ss]eason[\W_])[\d][\W_][\d]{1,2}(?=[\W_])'
+multiSeasonRegex2 = r'(?<=[\W_][Ss])[\d]{2}[\W_][Ss]?[\d]{2}(?=[\W_])'
+multiSeasonRegexCombined = f'{multiSeasonRegex1}|{multiSeasonRegex2}'
+
+multiSeasonPattern1 = re.compile(multiSeasonRegex1)
+multiSeasonPattern2 = re.compile(multiSeasonRegex2)
+multiSeasonPatternCombined = re.compile(multiSeasonRegexCombined)
+seasonEpisodePattern = re.compile(r'S([\d]{2})E[\d]{2}')
+
+class LinkPlan():
+    def __init__(self) -> None:
+        self.directories = set()
+        self.completedFolders = set()
+        self.links = []
+        self.created = []
+        self.skipped = []
+        self.conflicts = []
+
+    def add(self, completedFolder, relRoot, filename, target):
+        directory = os.path.join(completedFolder, relRoot)
+        self.directories.add(directory)
+        self.completedFolders.add(completedFolder)
+        self.links.append((os.path.join(directory, filename), target))
+
+    def summary(self):
+        return f"Linked {len(self.created)} files into {len(self.completedFolders)} folders, {len(self.skipped)} already linked, {len(self.conflicts)} conflicts"
+
+def walkFiles(folder):
+    # scandir gets the file type from the directory listing, sparing a stat per file on the mount
+    stack = [(folder, '')]
+    while stack:
+        path, relRoot = stack.pop()
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        stack.append((entry.path, os.path.join(relRoot, entry.name)))
+                else:
+                    yield relRoot, entry.name, entry.path
+
+def buildLinkPlan(sourceFolder, completedParentFolder, name, customRegex=None):
+    """Plans a link in completedParentFolder/name for every file under sourceFolder. Episodes of a multi-season pack get a folder per season instead."""
+    multiSeasonPattern = re.compile(f'{multiSeasonRegexCombined}|{customRegex}') if customRegex else multiSeasonPatternCombined
+    multiSeasonMatch = multiSeasonPattern.search(name)
+    completedFolder = os.path.join(completedParentFolder, name)
+    seasonFolders = {}
+    plan = LinkPlan()
+
+    for relRoot, filename, target in walkFiles(sourceFolder):
+        if multiSeasonMatch:
+            seasonMatch = seasonEpisodePattern.search(filename)
+
+            if seasonMatch:
+                season = seasonMatch.group(1)
+                if season not in seasonFolders:
+                    seasonShort = season[1:] if season[0] == '0' else season
+
+                    seasonName = multiSeasonPattern1.sub(seasonShort, name)
+                    seasonName = multiSeasonPattern2.sub(season, seasonName)
+                    if customRegex:
+                        seasonName = re.sub(customRegex, f' Season {seasonShort} S{season} ', seasonName)
+
+                    seasonFolders[season] = os.path.join(completedParentFolder, seasonName)
+
+                plan.add(seasonFolders[season], relRoot, filename, target)
+                continue
+
+        plan.add(completedFolder, relRoot, filename, target)
+
+    return plan
+
+def _link(link, target):
+    try:
+        os.symlink(target, link)
+        return 'created'
+    except FileExistsError:
+        return 'skipped' if os.path.islink(link) and os.readlink(link) == target else 'conflicts'
+
+def applyLinkPlan(plan: LinkPlan, workers: int=blackhole['symlinkWorkers']):
+    """Creates the plan's folders once each and its links in parallel. Links that already exist are skipped, so a plan can be applied again."""
+    for directory in sorted(plan.directories):
+        os.makedirs(directory, exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda link: _link(*link), plan.links))
+
+    for link, result in zip(plan.links, results):
+        getattr(plan, result).append(link)
+
+    return plan
+
+class SymlinkHealth():
+    __slots__ = ('path', 'realPath', 'isLink', 'exists', 'timedOut')
+
+    def __init__(self, path, realPath=None, isLink=False, exists=False, timedOut=False) -> None:
+        self.path = path
+        self.realPath = realPath
+        self.isLink = isLink
+        self.exists = exists
+        self.timedOut = timedOut
+
+    @property
+    def broken(self):
+        return self.isLink and not self.exists
+
+def _checkSymlink(path):
+    realPath = os.path.realpath(path)
+    return SymlinkHealth(path, realPath, os.path.islink(path), os.path.exists(realPath))
+
+def checkSymlinks(paths, workers: int=repair['scanWorkers'], timeout: float=repair['scanTimeout']):
+    """Checks where each path points and whether that exists, on a pool of threads. A path that takes longer than timeout is reported as timed out, so a hung mount cannot stall the scan."""
+    pending = queue.Queue()
+    for path in paths:
+        pending.put(path)
+
+    results = {}
+    running = {}
+    lock = threading.Lock()
+    state = {'workers': 0, 'stuck': 0}
+
+    def work():
+        while True:
+            with lock:
+                try:
+                    path = pending.get_nowait()
+                except queue.Empty:
+                    state['workers'] -= 1
+                    return
+                running[path] = time.monotonic()
+
+            health = _checkSymlink(path)
+
+            with lock:
+                if running.pop(path, None) is None:
+                    # Reported as timed out, but the thread is free again
+                    state['stuck'] -= 1
+                else:
+                    results[path] = health
+
+    def start():
+        state['workers'] += 1
+        # Daemon threads, so a stat that never returns cannot keep the process alive either
+        threading.Thread(target=work, name='symlinks', daemon=True).start()
+
+    with lock:
+        for _ in range(min(workers, pending.qsize())):
+            start()
+
+    while True:
+        with lock:
+            now = time.monotonic()
+            for path, started in list(running.items()):
+                if now - started > timeout:
+                    del running[path]
+                    results[path] = SymlinkHealth(path, timedOut=True)
+                    state['stuck'] += 1
+                    # Replaced while few are stuck, beyond that the mount is treated as hung
+                    if state['stuck'] <= workers:
+                        start()
+
+            if state['workers'] == state['stuck']:
+                while not pending.empty():
+                    path = pending.get_nowait()
+                    results[path] = SymlinkHealth(path, timedOut=True)
+                break
+
+        time.sleep(min(0.1, timeout / 10))
+
+    return results
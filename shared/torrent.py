@@ -0,0 +1,96 @@
+import hashlib
+
+def _parseInt(data: bytes, start: int, end: int):
+    return int(data[start:end])
+
+def _skip(data: bytes, i: int):
+    # Walks past one bencoded value without building it, returns the index right after it
+    depth = 0
+    while True:
+        char = data[i]
+        if char == 0x69: # i
+            i = data.index(b'e', i) + 1
+        elif 0x30 <= char <= 0x39: # 0-9
+            colon = data.index(b':', i)
+            i = colon + 1 + _parseInt(data, i, colon)
+        elif char == 0x6c or char == 0x64: # l, d
+            depth += 1
+            i += 1
+            continue
+        elif char == 0x65: # e
+            depth -= 1
+            i += 1
+        else:
+            raise ValueError(f"Invalid bencode at offset {i}")
+
+        if depth == 0:
+            return i
+
+def _readString(data: bytes, i: int):
+    colon = data.index(b':', i)
+    start = colon + 1
+    end = start + _parseInt(data, i, colon)
+    return data[start:end], end
+
+def _readInt(data: bytes, i: int):
+    end = data.index(b'e', i)
+    return _parseInt(data, i + 1, end), end + 1
+
+def _dictItems(data: bytes, i: int):
+    i += 1
+    while data[i] != 0x65:
+        key, i = _readString(data, i)
+        end = _skip(data, i)
+        yield key, i, end
+        i = end
+
+def _listItems(data: bytes, i: int):
+    i += 1
+    while data[i] != 0x65:
+        end = _skip(data, i)
+        yield i, end
+        i = end
+
+def _decodeString(value: bytes):
+    return value.decode('utf-8', errors='replace')
+
+def _readFiles(data: bytes, infoStart: int):
+    name = None
+    length = None
+    files = []
+
+    for key, start, end in _dictItems(data, infoStart):
+        # pieces is by far the largest value and is never copied
+        if key == b'name':
+            name = _decodeString(_readString(data, start)[0])
+        elif key == b'length':
+            length = _readInt(data, start)[0]
+        elif key == b'files':
+            for fileStart, _ in _listItems(data, start):
+                path = []
+                fileLength = 0
+                for fileKey, valueStart, _ in _dictItems(data, fileStart):
+                    if fileKey == b'length':
+                        fileLength = _readInt(data, valueStart)[0]
+                    elif fileKey == b'path':
+                        path = [_decodeString(_readString(data, partStart)[0]) for partStart, _ in _listItems(data, valueStart)]
+                files.append({'path': '/' + '/'.join(path), 'bytes': fileLength})
+
+    if not files and length is not None:
+        files.append({'path': f"/{name}", 'bytes': length})
+
+    # Same shape and ids as the files in RealDebrid's torrents/info
+    return [{'id': id, **file} for id, file in enumerate(files, start=1)]
+
+def scanTorrent(fileData: bytes):
+    """Returns the info hash and file list of a .torrent without decoding the pieces."""
+    if fileData[0] != 0x64:
+        raise ValueError("Torrent is not a bencoded dictionary")
+
+    for key, start, end in _dictItems(fileData, 0):
+        if key == b'info':
+            with memoryview(fileData) as view:
+                infoHash = hashlib.sha1(view[start:end]).hexdigest()
+            return infoHash, _readFiles(fileData, start)
+
+    raise ValueError("Torrent has no info dictionary")
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from shared.shared import blackhole
+
+class WarmUp():
+    """Reads the start and end of files on the mount so they are cached before the arr and Plex open them."""
+
+    def __init__(self, workers: int=blackhole['warmUpWorkers'], headBytes: int=blackhole['warmUpHeadBytes'], tailBytes: int=blackhole['warmUpTailBytes'], timeout: float=blackhole['warmUpTimeout']) -> None:
+        self.workers = workers
+        self.headBytes = headBytes
+        self.tailBytes = tailBytes
+        self.timeout = timeout
+        # Shared by every job, so the number of reads in flight on the mount stays bounded
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='warmup')
+        self._condition = None
+        # Reads in the executor, and those among them that already timed out but haven't returned
+        self._reading = 0
+        self._hung = 0
+
+    def _read(self, path: str):
+        start = time.monotonic()
+        with open(path, 'rb', buffering=0) as f:
+            f.read(self.headBytes)
+
+            size = os.fstat(f.fileno()).st_size
+            if self.tailBytes and size > self.headBytes:
+                f.seek(max(self.headBytes, size - self.tailBytes))
+                f.read(self.tailBytes)
+
+        return time.monotonic() - start
+
+    async def _finished(self, read, state):
+        if not read.cancelled():
+            # Also consumes the error of a read that already timed out
+            read.exception()
+
+        async with self._condition:
+            self._reading -= 1
+            if state['timedOut']:
+                self._hung -= 1
+            self._condition.notify_all()
+
+    async def _probe(self, path: str):
+        loop = asyncio.get_running_loop()
+        async with self._condition:
+            # A read that timed out keeps its thread until it returns, so the timer below never counts time queued behind it
+            while self._reading >= self.workers:
+                if self._hung < self.workers:
+                    await self._condition.wait()
+                    continue
+
+                # Every reader is stuck on the mount, give them one more timeout to come back
+                try:
+                    await asyncio.wait_for(self._condition.wait_for(lambda: self._reading < self.workers), timeout=self.timeout)
+                except asyncio.TimeoutError:
+                    return {'path': path, 'seconds': self.timeout, 'ok': False, 'error': 'timeout, every reader is stuck'}
+            self._reading += 1
+
+        start = time.monotonic()
+        state = {'timedOut': False}
+        read = loop.run_in_executor(self.executor, self._read, path)
+        read.add_done_callback(lambda _: loop.create_task(self._finished(read, state)))
+        try:
+            seconds = await asyncio.wait_for(asyncio.shield(read), timeout=self.timeout)
+            return {'path': path, 'seconds': seconds, 'ok': True, 'error': None}
+        except asyncio.TimeoutError:
+            if not read.done():
+                state['timedOut'] = True
+                self._hung += 1
+                async with self._condition:
+                    self._condition.notify_all()
+            return {'path': path, 'seconds': time.monotonic() - start, 'ok': False, 'error': 'timeout'}
+        except OSError as e:
+            return {'path': path, 'seconds': time.monotonic() - start, 'ok': False, 'error': str(e)}
+
+    async def probe(self, paths):
+        """Returns the latency and outcome of a probe for each path."""
+        if not self._condition:
+            self._condition = asyncio.Condition()
+
+        return await asyncio.gather(*(self._probe(path) for path in paths))